@@ -0,0 +1,202 @@
+"""
+Command line interface, see main.py
+
+The scripts are imported when their command runs, so pandas is only
+imported for flagging2discharge.
+"""
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+from FEWS_tools import logger
+from FEWS_tools.lib.utils import add_loghandler
+from FEWS_tools.lib.profiling import profiler, report_path
+
+
+# address of serve mode, host:port
+DEFAULT_ADDRESS = 'localhost:6789'
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from FEWS_tools.lib.dtypes import KEEP
+    from FEWS_tools.scripts.pixml2csv import PARSERS
+    from FEWS_tools.scripts.watch import INTERVAL, SETTLE
+
+    # init parsers - extend with subparser for new function
+    parser = argparse.ArgumentParser('FEWS Tools', description='Global options')
+
+    loglevels = ['DEBUG', 'INFO', 'WARNING']
+    parser.add_argument('-v', '--loglevel', choices=loglevels, default=loglevels[1])
+    parser.add_argument('-l', '--logfile', type=Path)
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile_memory', action='store_true',
+                        help='profile with peak memory by stage, adds tracemalloc overhead')
+    parser.add_argument('--server', metavar='HOST:PORT',
+                        help=f'run the command in serve mode, e.g. {DEFAULT_ADDRESS}')
+
+    # subparsers
+    formats = ['csv', 'parquet', 'feather']
+    subparsers = parser.add_subparsers(dest='command')
+
+    pixml2csv_parser = subparsers.add_parser(
+        'pixml2csv', description='pixml2csv options')
+    pixml2csv_parser.add_argument('-b', '--basename', required=True, type=Path)
+    pixml2csv_parser.add_argument('-f', '--filename', required=True, type=str)
+    pixml2csv_parser.add_argument('-o', '--output_folder', type=Path)
+    pixml2csv_parser.add_argument('-s', '--separate_events', action='store_false')
+    pixml2csv_parser.add_argument('-j', '--join_h_to_sl', action='store_true')
+    pixml2csv_parser.add_argument('-w', '--workers', type=int, default=1)
+    pixml2csv_parser.add_argument('-F', '--format', choices=formats, default=formats[0])
+    pixml2csv_parser.add_argument('-a', '--append', action='store_true')
+    pixml2csv_parser.add_argument('-P', '--parser', choices=PARSERS, default=PARSERS[0])
+    pixml2csv_parser.add_argument('-c', '--cache_folder', type=Path)
+    pixml2csv_parser.add_argument('-m', '--cache_size', type=int, default=1024,
+                                  help='maximum size of the cache folder in MB')
+    pixml2csv_parser.add_argument('-k', '--keep', choices=KEEP, default=KEEP[0],
+                                  help='duplicate series to keep, last is of the newest export')
+    pixml2csv_parser.add_argument('--pipeline', action='store_true',
+                                  help='write files in threads while joining the next')
+    pixml2csv_parser.add_argument('--writer_threads', type=int, default=2)
+
+    flagging2discharge_parser = subparsers.add_parser(
+        'flagging2discharge', description='update flagging options')
+    flagging2discharge_parser.add_argument('-b', '--basename', required=True, type=Path)
+    flagging2discharge_parser.add_argument('-p', '--damo_pomp', required=True, type=str)
+    flagging2discharge_parser.add_argument('-o', '--output_folder', type=Path)
+    flagging2discharge_parser.add_argument('-F', '--format', choices=formats, default=formats[0])
+    flagging2discharge_parser.add_argument('-w', '--workers', type=int, default=1)
+    flagging2discharge_parser.add_argument('-i', '--incremental', action='store_true')
+    flagging2discharge_parser.add_argument('-c', '--chunksize', type=int)
+
+    watch_parser = subparsers.add_parser(
+        'watch', description='convert new exports and update their flagging as they land')
+    watch_parser.add_argument('-b', '--basename', required=True, type=Path)
+    watch_parser.add_argument('-f', '--filename', required=True, type=str)
+    watch_parser.add_argument('-o', '--output_folder', type=Path)
+    watch_parser.add_argument('-p', '--damo_pomp', type=Path,
+                              help='update flagging of the files in --flag_folder')
+    watch_parser.add_argument('-u', '--flag_folder', type=Path,
+                              help='files to update flagging of, the output folder by default')
+    watch_parser.add_argument('-s', '--separate_events', action='store_false')
+    watch_parser.add_argument('-j', '--join_h_to_sl', action='store_true')
+    watch_parser.add_argument('-w', '--workers', type=int, default=1)
+    watch_parser.add_argument('-F', '--format', choices=formats, default=formats[0])
+    watch_parser.add_argument('-P', '--parser', choices=PARSERS, default=PARSERS[0])
+    watch_parser.add_argument('-c', '--cache_folder', type=Path,
+                              help='parse cache, .watch_cache in the basename by default')
+    watch_parser.add_argument('-k', '--keep', choices=KEEP, default=KEEP[0],
+                              help='duplicate series to keep, last is of the newest export')
+    watch_parser.add_argument('-i', '--incremental', action='store_true')
+    watch_parser.add_argument('-n', '--interval', type=float, default=INTERVAL,
+                              help='seconds between polls')
+    watch_parser.add_argument('--settle', type=float, default=SETTLE,
+                              help='seconds a file is unchanged before it is processed')
+    watch_parser.add_argument('--poll', action='store_true',
+                              help='scan the folders, also when watchdog is installed')
+    watch_parser.add_argument('--once', action='store_true',
+                              help='process new and changed files once and exit')
+
+    serve_parser = subparsers.add_parser(
+        'serve', description='keep the tools loaded and run commands sent with --server')
+    serve_parser.add_argument('-a', '--address', default=DEFAULT_ADDRESS)
+
+    subparsers.add_parser('stop', description='stop serve mode at --server')
+    return parser
+
+
+def run(args: argparse.Namespace) -> None:
+    '''run a pixml2csv, flagging2discharge or watch command in this process'''
+    logger.setLevel(args.loglevel)
+
+    handler = None
+    if args.logfile is not None:
+        fmt = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        handler = add_loghandler(logger, logging.FileHandler, logging.DEBUG, fmt,
+                                 filename=args.logfile, mode='a')
+
+        logger.debug('Logger Initialized')
+
+    profile = args.profile or args.profile_memory
+    if profile:
+        profiler.enable(trace_memory=args.profile_memory)
+
+    try:
+        if args.command == 'pixml2csv':
+            from FEWS_tools.scripts.pixml2csv import convert_pixml2csv
+
+            convert_pixml2csv(
+                args.basename, args.filename, args.output_folder, args.separate_events,
+                args.join_h_to_sl, args.workers, args.format, args.append, args.parser,
+                args.cache_folder, args.cache_size * 2**20, args.keep, args.pipeline,
+                args.writer_threads)
+
+            logger.info('Conversion completed!')
+
+        elif args.command == 'flagging2discharge':
+            from FEWS_tools.scripts.flagging2discharge import update_flagging
+
+            update_flagging(
+                args.basename, args.damo_pomp, args.output_folder, args.format, args.workers,
+                incremental=args.incremental, chunksize=args.chunksize)
+
+            logger.info('Update completed!')
+
+        elif args.command == 'watch':
+            from FEWS_tools.scripts.watch import Watcher
+
+            watcher = Watcher(
+                args.basename, args.filename, args.output_folder, args.damo_pomp,
+                args.flag_folder, args.format, args.settle,
+                convert_options={
+                    'join_events': args.separate_events, 'H_to_SL': args.join_h_to_sl,
+                    'workers': args.workers, 'parser': args.parser,
+                    'cache_folder': args.cache_folder, 'keep': args.keep},
+                update_options={'workers': args.workers, 'incremental': args.incremental})
+            if args.once:
+                watcher.poll()
+            else:
+                watcher.run(args.interval, events=not args.poll)
+
+        if profile:
+            report = report_path(args.logfile)
+            profiler.write(report, command=args.command)
+            logger.info(f'Saved profile to {report}')
+    finally:
+        if profile:
+            profiler.disable()
+        if handler is not None:
+            logger.removeHandler(handler)
+            handler.close()
+
+
+def main(argv: list = None) -> int:
+    '''entry point of main.py, returns the exit code'''
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        from FEWS_tools.scripts.server import serve
+
+        logger.setLevel(args.loglevel)
+        serve(args.address)
+
+    elif args.command == 'stop' or args.server is not None:
+        from FEWS_tools.scripts.server import SERVED_COMMANDS, submit
+
+        if args.command not in (*SERVED_COMMANDS, 'stop'):
+            parser.error(f'{args.command} is not run in serve mode')
+        try:
+            return submit(args.server or DEFAULT_ADDRESS, argv, stop=args.command == 'stop')
+        except RuntimeError as e:
+            logger.error(e)
+            return 1
+
+    elif args.command is not None:
+        run(args)
+
+    else:
+        parser.print_usage()
+    return 0
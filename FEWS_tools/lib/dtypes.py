@@ -1,40 +1,86 @@
-class isString:
-    def __set_name__(self, owner, name):
-        self.public_name = name
-        self.private_name = f'_{name}'
+def check_string(name, value):
+    '''raise TypeError unless value is a string or a tuple of strings'''
+    if not isinstance(value, str):
+        if not (isinstance(value, tuple) and all(isinstance(v, str) for v in value)):
+            raise TypeError(f'{name} takes string arguments only')
 
-    def __get__(self, obj, objtype=None):
-        return getattr(obj, self.private_name)
 
-    def __set__(self, obj, value):
-        if not isinstance(value, str):
-            if not (isinstance(value, tuple) and all(isinstance(v, str) for v in value)):
-                raise TypeError(f'{self.public_name} takes string arguments only')
-
-        setattr(obj, self.private_name, value)
+def lower(value):
+    if isinstance(value, tuple):
+        return tuple(i.lower() for i in value)
+    return value.lower()
 
 
 class GroupSet:
-    group_key = isString()
-    sort_keys = isString()
+    '''
+    Case insensitive identity by sort_keys, grouped by group_key.
+
+    The keys are checked and normalized once, the lowercase group and
+    key and the hash are stored, so equality, ordering and hashing do
+    not rebuild them. The keys are not meant to change after init.
+    '''
+    __slots__ = ('group_key', 'sort_keys', 'group', 'key', '_hash')
 
     def __init__(self, group_key: str, *sort_keys: tuple[str]):
+        check_string('group_key', group_key)
+        check_string('sort_keys', sort_keys)
+
         self.group_key = group_key
         self.sort_keys = sort_keys or (group_key,)
+        self.group = lower(group_key)
+        self.key = tuple(lower(i) for i in self.sort_keys)
+        self._hash = hash(self.key)
 
     def __repr__(self):
         return (f'''{self.__class__.__name__}'''
                 f'''({self.group_key}, {', '.join(self.sort_keys)})''')
 
     def __lt__(self, other):
-        return self.__hash__() < other.__hash__()
+        if not isinstance(other, GroupSet):
+            return NotImplemented
+        return self.key < other.key
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        if not isinstance(other, GroupSet):
+            return NotImplemented
+        return self.key == other.key
 
     def __hash__(self):
-        return hash(tuple(i.lower() for i in self.sort_keys))
+        return self._hash
 
     @staticmethod
     def grouper(instance):
-        return instance.group_key.lower()
+        return instance.group
+
+
+# which of equal items is kept by deduplicate
+KEEP = ('first', 'last')
+
+
+def deduplicate(items, keep='first', age=None):
+    '''
+    Remove duplicate GroupSet items in a single pass.
+
+    Of equal items the first or last is kept, the result is in order of
+    the first occurrence of each item. With an age function, the item of
+    the lowest (first) or highest (last) age is kept instead, equal ages
+    by position.
+    '''
+    if keep not in KEEP:
+        raise ValueError(f'{keep} is not a valid keep, choose from {KEEP}')
+
+    index = {}
+    if age is not None:
+        replaces = (lambda x, y: age(x) < age(y)) if keep == 'first' else \
+            (lambda x, y: age(x) >= age(y))
+        for item in items:
+            kept = index.setdefault(item, item)
+            if kept is not item and replaces(item, kept):
+                index[item] = item
+    elif keep == 'first':
+        for item in items:
+            index.setdefault(item, item)
+    else:
+        for item in items:
+            index[item] = item
+    return list(index.values())
@@ -1,11 +1,435 @@
 import datetime as dt
-from collections import ChainMap
+import itertools as it
 from xml.etree.ElementTree import Element
 
+import numpy as np
+
+from FEWS_tools import logger
 from FEWS_tools.lib.utils import ns
 from FEWS_tools.lib.dtypes import GroupSet
 
 
+# flag of timesteps that are padded when joining series
+MISSING_FLAG = 9
+
+# flag of events without a flag attribute, written as an empty field
+NO_FLAG = -128
+
+# string form of all int8 flags, offset by 128
+FLAG_STRINGS = np.array(['', *(str(i) for i in range(-127, 128))], dtype=object)
+
+# attributes of <event>-tags stored as columns, others are kept as text, see Events.extra
+EVENT_ATTRIBUTES = ('date', 'time', 'value', 'flag')
+
+def parse_datetimes(dates: list, times: list) -> np.ndarray:
+    '''
+    YYYY-MM-DD dates and HH:MM:SS times to datetime64[s].
+
+    Fixed-format strings are converted in one step by arithmetic on their
+    ASCII digits. Any other form falls back to the ISO parser of numpy.
+    '''
+    n = len(dates)
+    if not n:
+        return np.array([], dtype='datetime64[s]')
+    try:
+        date_bytes = np.frombuffer(''.join(dates).encode('ascii'), dtype=np.uint8)
+        time_bytes = np.frombuffer(''.join(times).encode('ascii'), dtype=np.uint8)
+    except UnicodeEncodeError:
+        date_bytes = time_bytes = np.array([], dtype=np.uint8)
+
+    if date_bytes.size == 10 * n and time_bytes.size == 8 * n:
+        date_bytes = date_bytes.reshape(n, 10)
+        time_bytes = time_bytes.reshape(n, 8)
+        digits = np.concatenate([date_bytes[:, [0, 1, 2, 3, 5, 6, 8, 9]],
+                                 time_bytes[:, [0, 1, 3, 4, 6, 7]]], axis=1) - ord('0')
+        separators = np.concatenate([date_bytes[:, [4, 7]] - ord('-'),
+                                     time_bytes[:, [2, 5]] - ord(':')], axis=1)
+
+        if (digits <= 9).all() and not separators.any():
+            d = digits.astype(np.int64)
+            year = d[:, 0] * 1000 + d[:, 1] * 100 + d[:, 2] * 10 + d[:, 3]
+            month = d[:, 4] * 10 + d[:, 5]
+            day = d[:, 6] * 10 + d[:, 7]
+            seconds = (d[:, 8] * 10 + d[:, 9]) * 3600 + (d[:, 10] * 10 + d[:, 11]) * 60 \
+                + d[:, 12] * 10 + d[:, 13]
+
+            months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+            month_days = (months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')
+            valid = ((1 <= month) & (month <= 12) & (1 <= day) & (day <= month_days.astype(int))
+                     & (d[:, 8:14:2] <= [2, 5, 5]).all(axis=1) & (d[:, 8] * 10 + d[:, 9] < 24))
+            if valid.all():
+                return months.astype('datetime64[D]').astype('datetime64[s]') \
+                    + (day - 1) * 86400 + seconds
+
+    return np.char.add(np.char.add(dates, 'T'), times).astype('datetime64[s]')
+
+
+class Events:
+    '''
+    Columnar storage of the <event>-tags in a <series>-tag.
+
+    Timestamps are stored as datetime64, values as floats and flags as
+    small integers. Missing values are stored as NaN and are written
+    back as the missVal of the series, events without a flag have
+    NO_FLAG. The string form of the columns is only built on demand,
+    see EventTable.
+
+    The exported value strings are kept in text and written as is, so
+    e.g. 1.50 is not written as 1.5. text is None for values without a
+    string form, e.g. read from PI binary files. Other attributes of
+    the <event>-tags are kept in extra by name, empty where absent.
+
+    The arrays are read-only, so events can be shared between joins.
+    '''
+    __slots__ = ('datetime', 'value', 'flag', 'missVal', 'text', 'extra')
+
+    def __init__(self, datetime: np.ndarray, value: np.ndarray, flag: np.ndarray,
+                 missVal: str, text: np.ndarray = None, extra: dict = None) -> None:
+        self.extra = extra or {}
+        for array in (datetime, value, flag, text, *self.extra.values()):
+            if array is not None:
+                array.setflags(write=False)
+
+        self.datetime = datetime
+        self.value = value
+        self.flag = flag
+        self.missVal = missVal
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    @classmethod
+    def from_strings(cls, dates: list, times: list, values: list,
+                     flags: list, missVal: str, extra: dict = None) -> 'Events':
+        '''
+        build from event attributes - empty when all no data values
+
+        flags are None for events without a flag, extra holds the strings
+        of other attributes by name.
+        '''
+        text = np.array(values, dtype=object)
+        missing = text == missVal
+        if missing.all():
+            return cls.empty(missVal)
+
+        datetime = parse_datetimes(dates, times)
+        value = np.where(missing, 'nan', np.array(values, dtype=str)).astype(float)
+        if None in flags:
+            flags = [str(NO_FLAG) if i is None else i for i in flags]
+        flag = np.array(flags, dtype=str).astype(np.int8)
+        extra = {k: np.array(v, dtype=object) for k, v in (extra or {}).items()}
+        return cls(datetime, value, flag, missVal, text, extra)
+
+    @classmethod
+    def from_values(cls, value: np.ndarray, start: dt.datetime, timedelta: dt.timedelta,
+                    missVal: str) -> 'Events':
+        '''
+        build from the values of an equidistant series - empty when all no data values
+
+        The value array is used as is, e.g. a float32 memmap of a PI binary
+        file, unless missVal is a number other than NaN. Flags are 0.
+        '''
+        try:
+            missing_value = float(missVal)
+        except ValueError:
+            missing_value = np.nan
+
+        missing = np.isnan(value)
+        if not np.isnan(missing_value):
+            missing |= value == value.dtype.type(missing_value)
+        if missing.all():
+            return cls.empty(missVal)
+        if not np.isnan(missing_value) and missing.any():
+            value = np.where(missing, np.nan, value).astype(value.dtype)
+
+        datetime = np.datetime64(start, 's') \
+            + np.arange(len(value)) * np.timedelta64(timedelta).astype('timedelta64[s]')
+        flag = np.zeros(len(value), dtype=np.int8)
+        return cls(datetime, value, flag, missVal)
+
+    @classmethod
+    def empty(cls, missVal: str) -> 'Events':
+        return cls(np.array([], dtype='datetime64[s]'), np.array([], dtype=float),
+                   np.array([], dtype=np.int8), missVal)
+
+
+class EventTable:
+    '''
+    Events of one or more series aligned on a shared time index.
+
+    Values and flags are 2-D arrays with a row per timestep and a column
+    per series. Timesteps absent in a series are padded with NaN, which is
+    written as the missVal of that series, and flagged with MISSING_FLAG.
+    texts holds the value strings per series, or None, see Events. The
+    extra attributes of a single series are written as trailing columns.
+    '''
+    __slots__ = ('datetime', 'value', 'flag', 'labels', 'missVals', 'texts', 'extra')
+
+    def __init__(self, datetime: np.ndarray, value: np.ndarray, flag: np.ndarray,
+                 labels: list[tuple[str, str]], missVals: list[str],
+                 texts: list[np.ndarray] = None, extra: dict = None) -> None:
+        self.datetime = datetime
+        self.value = value
+        self.flag = flag
+        self.labels = labels
+        self.missVals = missVals
+        self.texts = texts or [None] * len(missVals)
+        self.extra = extra or {}
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    @classmethod
+    def outer_join(cls, events: list[Events], labels: list[tuple[str, str]],
+                   step: dt.timedelta = None) -> 'EventTable':
+        '''
+        align events on the union of their timestamps, labels are (value, flag) names
+
+        With a step, the index holds every step from the first to the last
+        timestamp, so gaps shared by all series are padded as well. The
+        extra attributes of joined series have no column of their own and
+        are not kept.
+        '''
+        missVals = [e.missVal for e in events]
+        values = [e.value for e in events]
+        texts = [e.text for e in events]
+        extra = events[0].extra if len(events) == 1 else {}
+        if len(events) > 1 and any(e.extra for e in events):
+            logger.warning(f'Event attributes {sorted(set().union(*(e.extra for e in events)))} '
+                           'of joined series are not written')
+
+        # float32 is kept when all series are float32, e.g. read from PI binary files
+        dtype = np.result_type(*values)
+        if dtype != np.float32:
+            values = [as_float64(i) for i in values]
+
+        if step is not None:
+            step = np.timedelta64(step).astype('timedelta64[s]')
+
+        # shared and continuous time index - stack directly
+        datetime = events[0].datetime
+        if all(np.array_equal(e.datetime, datetime) for e in events[1:]) and (
+                step is None or bool(np.all(np.diff(datetime) == step))):
+            value = np.column_stack(values)
+            flag = np.column_stack([e.flag for e in events])
+            return cls(datetime, value, flag, labels, missVals, texts, extra)
+
+        # different start times or gaps - place events on the union
+        datetime = np.unique(np.concatenate([e.datetime for e in events]))
+        if step is not None and len(datetime):
+            # timestamps off the steps are kept
+            datetime = np.union1d(np.arange(datetime[0], datetime[-1] + step, step), datetime)
+        value = np.full((len(datetime), len(events)), np.nan, dtype=dtype)
+        flag = np.full((len(datetime), len(events)), MISSING_FLAG, dtype=np.int8)
+        for column, e in enumerate(events):
+            rows = np.searchsorted(datetime, e.datetime)
+            value[rows, column] = values[column]
+            flag[rows, column] = e.flag
+            if e.text is not None:
+                texts[column] = pad(rows, e.text, len(datetime), e.missVal)
+        # extra is only kept for a single series, rows are its rows
+        extra = {k: pad(rows, v, len(datetime), '') for k, v in extra.items()}
+        return cls(datetime, value, flag, labels, missVals, texts, extra)
+
+    @property
+    def columns(self) -> list[str]:
+        return ['date', 'time', *it.chain(*self.labels), *self.extra]
+
+    def select(self, rows: slice) -> 'EventTable':
+        '''rows of the table as EventTable, the arrays are views'''
+        return EventTable(self.datetime[rows], self.value[rows], self.flag[rows],
+                          self.labels, self.missVals,
+                          [None if i is None else i[rows] for i in self.texts],
+                          {k: v[rows] for k, v in self.extra.items()})
+
+    def reorder(self, columns: list[str]) -> 'EventTable':
+        '''the table with its series in the order of columns, None when the columns differ'''
+        labels = [tuple(columns[i:i + 2]) for i in range(2, 2 + 2 * len(self.labels), 2)]
+        positions = {label: i for i, label in enumerate(self.labels)}
+        if sorted(columns) != sorted(self.columns) or columns[:2] != ['date', 'time'] \
+                or any(i not in positions for i in labels):
+            return None
+
+        order = [positions[i] for i in labels]
+        return EventTable(self.datetime, self.value[:, order], self.flag[:, order], labels,
+                          [self.missVals[i] for i in order], [self.texts[i] for i in order],
+                          {k: self.extra[k] for k in columns[2 + 2 * len(labels):]})
+
+    def format_columns(self, rows: slice = slice(None)) -> list[list[str]]:
+        '''string form of the columns in self.columns for the selected rows'''
+        datetime = self.datetime[rows]
+        columns = [format_dates(datetime), format_times(datetime)]
+        for column, (missVal, text) in enumerate(zip(self.missVals, self.texts)):
+            if text is None:
+                columns.append(format_values(self.value[rows, column], missVal))
+            else:
+                columns.append(text[rows].tolist())
+            columns.append(format_flags(self.flag[rows, column]))
+        columns.extend(i[rows].tolist() for i in self.extra.values())
+        return columns
+
+    def to_block(self) -> np.ndarray:
+        '''string form of the table as 2-D array, columns as in self.columns'''
+        block = np.empty((len(self), len(self.columns)), dtype=object)
+        for i, column in enumerate(self.format_columns()):
+            block[:, i] = column
+        return block
+
+    def iter_csv(self, chunksize: int, lineterminator: str = '\r\n') -> iter:
+        '''yield csv text of chunksize rows at a time'''
+        for start in range(0, len(self), chunksize):
+            columns = self.format_columns(slice(start, start + chunksize))
+            # values and flags hold no separators, extra attributes may
+            for i in range(len(columns) - len(self.extra), len(columns)):
+                columns[i] = quote_fields(columns[i])
+            lines = map(','.join, zip(*columns))
+            yield lineterminator.join(lines) + lineterminator
+
+
+def pad(rows: np.ndarray, text: np.ndarray, length: int, fill: str) -> np.ndarray:
+    '''strings placed at rows of an array of length, other rows are fill'''
+    padded = np.full(length, fill, dtype=object)
+    padded[rows] = text
+    return padded
+
+
+def quote_fields(fields: list[str]) -> list[str]:
+    '''quote fields with separators, quotes or line breaks as the csv module does'''
+    return ['"' + i.replace('"', '""') + '"' if any(c in i for c in ',"\r\n') else i
+            for i in fields]
+
+
+def format_dates(datetime: np.ndarray) -> list[str]:
+    '''datetime64 to YYYY-MM-DD - each unique day is formatted once'''
+    days, inverse = np.unique(datetime.astype('datetime64[D]'), return_inverse=True)
+    strings = np.datetime_as_string(days).astype(object)
+    return strings[inverse].tolist()
+
+
+def format_times(datetime: np.ndarray) -> list[str]:
+    '''datetime64 to HH:MM:SS - each unique time of day is formatted once'''
+    seconds = (datetime - datetime.astype('datetime64[D]')).astype('timedelta64[s]')
+    seconds, inverse = np.unique(seconds.astype(np.int64), return_inverse=True)
+    strings = np.array(
+        [f'{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}' for s in seconds.tolist()],
+        dtype=object)
+    return strings[inverse].tolist()
+
+
+def as_float64(value: np.ndarray) -> np.ndarray:
+    '''float values as float64, float32 values through their shortest decimal form'''
+    if value.dtype != np.float32:
+        return value.astype(float, copy=False)
+    value, inverse = np.unique(value, return_inverse=True)
+    return value.astype(str).astype(float)[inverse.ravel()]
+
+
+def format_values(value: np.ndarray, missVal: str) -> list[str]:
+    '''
+    shortest representation, integral values without decimals and NaN as missVal
+
+    each unique value is formatted once, float32 values in their own precision
+    '''
+    value, inverse = np.unique(value, return_inverse=True)
+    missing = np.isnan(value)
+    integral = ~missing & (value == np.round(value)) & (np.abs(value) < 2**53)
+
+    if value.dtype == np.float32:
+        strings = value.astype(str).astype(object)
+    else:
+        strings = np.array(list(map(repr, value.tolist())), dtype=object)
+    strings[integral] = list(map(str, value[integral].astype(np.int64).tolist()))
+    strings[missing] = missVal
+    return strings[inverse.ravel()].tolist()
+
+
+def format_flags(flag: np.ndarray) -> list[str]:
+    '''int8 flags to strings through a lookup table, NO_FLAG is empty'''
+    return FLAG_STRINGS[flag.astype(np.int16) + 128].tolist()
+
+
+def parse_event_elements(elements: iter, missVal: str) -> Events:
+    '''
+    Events of <event>-elements.
+
+    The flag is optional, other attributes than EVENT_ATTRIBUTES are
+    collected in order of appearance, see Events.extra.
+    '''
+    dates, times, values, flags = [], [], [], []
+    other = []
+    for event_element in elements:
+        event_attrib = event_element.attrib
+        dates.append(event_attrib['date'])
+        times.append(event_attrib['time'])
+        values.append(event_attrib['value'])
+        flag = event_attrib.get('flag')
+        flags.append(flag)
+        if flag is None or len(event_attrib) != 4:
+            other.append((len(dates) - 1, event_attrib))
+
+    extra = {}
+    for row, event_attrib in other:
+        for name, text in event_attrib.items():
+            if name not in EVENT_ATTRIBUTES:
+                extra.setdefault(name, [''] * len(dates))[row] = text
+    return Events.from_strings(dates, times, values, flags, missVal, extra)
+
+
+class Header:
+    '''
+    Parsed <header>-tag of a <series>-tag.
+
+    The header element is read once, which turns the TimeSerie
+    properties into plain attribute reads.
+    '''
+    __slots__ = ('stationName', 'location', 'sublocation', 'locationId', 'parameterId',
+                 'missVal', 'timedelta', 'start_datetime', 'end_datetime')
+
+    def __init__(self, stationName: str, locationId: str, parameterId: str, missVal: str,
+                 timedelta: dt.timedelta, start_datetime: dt.datetime,
+                 end_datetime: dt.datetime) -> None:
+        self.stationName = stationName
+        *_, self.location, self.sublocation = stationName.split('_')
+        self.locationId = locationId
+        self.parameterId = parameterId
+        self.missVal = missVal
+        self.timedelta = timedelta
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+
+    @classmethod
+    def from_element(cls, header: Element, namespace: str) -> 'Header':
+        def text(tag):
+            return header.find(ns(tag, namespace)).text
+
+        def attrib(tag):
+            return header.find(ns(tag, namespace)).attrib
+
+        return cls(
+            text('stationName'), text('locationId'), text('parameterId'), text('missVal'),
+            cls.parse_timestep(attrib('timeStep')),
+            cls.parse_datetime(attrib('startDate')),
+            cls.parse_datetime(attrib('endDate')))
+
+    @staticmethod
+    def parse_datetime(attrib: dict) -> dt.datetime:
+        return dt.datetime.strptime(
+            f'{attrib["date"]} {attrib["time"]}', '%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def parse_timestep(timeStep: dict) -> dt.timedelta:
+        unit = timeStep['unit']
+
+        if unit == 'nonequidistant':
+            return dt.timedelta()
+        try:
+            multiplier = timeStep['multiplier']
+            return dt.timedelta(**{f'{unit}s': int(multiplier)})
+        except TypeError as e:
+            raise TypeError(f'{unit} is not implemented as a valid timestep.') from e
+
+
 class TimeSerie(GroupSet):
     '''
     Abstraction of <series>-tag in PIXML_timeseries.
@@ -15,6 +439,8 @@ class TimeSerie(GroupSet):
     the unique sort keys are a combination of
     the locationId and parameterId.
     '''
+    __slots__ = ('namespace', 'header', 'events', 'input_position', 'export_mtime')
+
     def __init__(self, series: iter, namespace: str) -> None:
         self.namespace = namespace
 
@@ -22,29 +448,38 @@ class TimeSerie(GroupSet):
         self.header = self.parse_header(series)
         self.events = self.parse_events(series)
 
+        # position in the input, see record_input_order
+        self.input_position = None
+        # modification time of the export file, duplicates are resolved by it
+        self.export_mtime = None
+
         # instantiate GroupSet
         super().__init__(self.get_group_key(), self.locationId, self.parameterId)
 
+    @classmethod
+    def from_parsed(cls, header: Header, events: Events, namespace: str) -> 'TimeSerie':
+        '''TimeSerie of an already parsed header and events, see parsecache'''
+        timeserie = cls.__new__(cls)
+        timeserie.namespace = namespace
+        timeserie.header = header
+        timeserie.events = events
+        timeserie.input_position = None
+        timeserie.export_mtime = None
+        GroupSet.__init__(
+            timeserie, timeserie.get_group_key(), timeserie.locationId, timeserie.parameterId)
+        return timeserie
+
     def __repr__(self) -> str:
         return f'<TimeSerie({self.location}, {self.locationId}, {self.parameterId})>'
     
-    def parse_header(self, series: iter) -> Element:
-        return list(series.iter(ns('header', self.namespace)))[0]
-
-    def parse_events(self, series: iter) -> list[dict]:
-        '''parse events - return empty list when all no data values'''
-        nodata = True
-        events = []
-        for event_element in series.iter(ns('event', self.namespace)):
-            event_attrib = event_element.attrib
-            events.append(event_attrib)
-
-            if event_attrib['value'] != self.missVal:
-                nodata = False
+    def parse_header(self, series: iter) -> Header:
+        header = list(series.iter(ns('header', self.namespace)))[0]
+        return Header.from_element(header, self.namespace)
 
-        if nodata:
-            return []
-        return events
+    def parse_events(self, series: iter) -> Events:
+        '''parse events - return empty Events when all no data values'''
+        # etree and lxml elements alike, the attributes are read per event
+        return parse_event_elements(series.iter(ns('event', self.namespace)), self.missVal)
 
     def get_group_key(self) -> str:
         '''group by VL*, P* or H'''
@@ -62,52 +497,39 @@ class TimeSerie(GroupSet):
 
     @property
     def stationName(self) -> str:
-        return self.header.find(ns('stationName', self.namespace)).text
+        return self.header.stationName
 
     @property
     def location(self) -> str:
-        return self.stationName.split('_')[-2]
+        return self.header.location
 
     @property
     def sublocation(self) -> str:
-        return self.stationName.split('_')[-1]
+        return self.header.sublocation
 
     @property
     def locationId(self) -> str:
-        return self.header.find(ns('locationId', self.namespace)).text
+        return self.header.locationId
 
     @property
     def parameterId(self) -> str:
-        return self.header.find(ns('parameterId', self.namespace)).text
+        return self.header.parameterId
 
     @property
     def missVal(self) -> str:
-        return self.header.find(ns('missVal', self.namespace)).text
+        return self.header.missVal
 
     @property
     def start_datetime(self) -> dt.datetime:
-        element = ns('startDate', self.namespace)
-        date, time = self.header.find(element).attrib.values()
-        return dt.datetime.strptime(f'{date} {time}', '%Y-%m-%d %H:%M:%S')
+        return self.header.start_datetime
 
     @property
     def end_datetime(self) -> dt.datetime:
-        element = ns('endDate', self.namespace)
-        date, time = self.header.find(element).attrib.values()
-        return dt.datetime.strptime(f'{date} {time}', '%Y-%m-%d %H:%M:%S')
+        return self.header.end_datetime
 
     @property
     def timedelta(self) -> dt.timedelta:
-        timeStep = self.header.find(ns('timeStep', self.namespace)).attrib
-        unit = timeStep['unit']
-
-        if unit == 'nonequidistant':
-            return dt.timedelta()
-        try:
-            multiplier = timeStep['multiplier']
-            return dt.timedelta(**{f'{unit}s': int(multiplier)})
-        except TypeError as e:
-            raise e(f'{unit} is not implemented as a valid timestep.')
+        return self.header.timedelta
 
     @property
     def is_equidistant(self) -> bool:
@@ -119,36 +541,46 @@ class TimeSerie(GroupSet):
             dt = self.timedelta
             start = self.start_datetime
             end = self.end_datetime
-            return (end - start + dt) / dt == len(self.events)
+            steps = np.diff(self.events.datetime)
+            return ((end - start + dt) / dt == len(self.events)
+                    and bool(np.all(steps == np.timedelta64(dt))))
         return False
 
-    def update_events(self) -> None:
-        '''update event keys with series specific names'''
+    @property
+    def column_labels(self) -> tuple[str, str]:
+        '''series specific value and flag column names'''
         column_suffix = f'{self.sublocation}_{self.parameterId}'
-        for event in self.events:
-            event[f'value_{column_suffix}'] = event.pop('value')
-            event[f'flag_{column_suffix}'] = event.pop('flag')
+        return f'value_{column_suffix}', f'flag_{column_suffix}'
+
+    @property
+    def input_key(self) -> str:
+        return f'{self.locationId}{self.parameterId}'
+
+    @staticmethod
+    def record_input_order(timeseries) -> None:
+        '''set input_position to the first position of the input_key in timeseries'''
+        positions = {}
+        for position, timeserie in enumerate(timeseries):
+            timeserie.input_position = positions.setdefault(timeserie.input_key, position)
+
+    def to_table(self) -> EventTable:
+        return EventTable.outer_join([self.events], [('value', 'flag')])
 
     @staticmethod
-    def join_events(timeseries) -> list[ChainMap]:
-        '''join events on same timestep to a single collection'''
+    def join_events(timeseries) -> EventTable:
+        '''
+        join events on a shared time index to a single table
+
+        Series with different start times or gaps are outer joined on
+        every timestep, absent timesteps are padded with missVal. The series are not
+        modified, columns are named after TimeSerie.column_labels.
+        '''
         if isinstance(timeseries, TimeSerie):
             timeseries = [timeseries]
 
         if not all(t.is_equidistant for t in timeseries):
             raise ValueError('Nonequidistant events cannot be joined.')
 
-        if not len(set(t.start_datetime for t in timeseries)) == 1:
-            raise ValueError('Equidistant events should have equal start times.')
-
-        if not all(t.has_continuous_timeindex for t in timeseries):
-            raise ValueError(f'Not all events have a continuous time index.')
-
-        # update events with series specific names
-        for timeserie in timeseries:
-            timeserie.update_events()
-
-        # construct single collection per timestep
-        # insertion order is reversed because of reversal in chainmap
-        events = [t.events for t in reversed(timeseries)]
-        return [ChainMap(*i) for i in zip(*events)]
+        return EventTable.outer_join(
+            [t.events for t in timeseries], [t.column_labels for t in timeseries],
+            timeseries[0].timedelta)
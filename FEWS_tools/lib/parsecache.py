@@ -0,0 +1,162 @@
+import os
+import pickle
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from FEWS_tools import logger
+from FEWS_tools.lib.utils import file_hash, bin_path
+from FEWS_tools.lib.models import Events, Header, TimeSerie
+
+
+# bump when the layout of a cache entry changes
+CACHE_VERSION = 3
+
+# default size of a parse cache folder in bytes
+CACHE_MAXSIZE = 2**30
+
+# Header.__init__ arguments, stored per series
+HEADER_FIELDS = ('stationName', 'locationId', 'parameterId', 'missVal',
+                 'timedelta', 'start_datetime', 'end_datetime')
+
+
+def dump_series(timeseries: list[TimeSerie]) -> dict:
+    '''
+    Header fields and concatenated event columns of parsed series.
+
+    The events of series i are rows offsets[i]:offsets[i + 1] of the
+    datetime, value and flag columns. The value dtype of each series is
+    kept, float32 values of PI binary files round trip through float64.
+    The value strings and extra attributes are kept per series.
+    '''
+    events = [t.events for t in timeseries]
+    offsets = np.cumsum([0] + [len(i) for i in events])
+
+    def column(attribute, dtype):
+        if not events:
+            return np.array([], dtype=dtype)
+        return np.concatenate([getattr(i, attribute) for i in events])
+
+    return {
+        'headers': [tuple(getattr(t.header, i) for i in HEADER_FIELDS) for t in timeseries],
+        'dtypes': [i.value.dtype.str for i in events],
+        'offsets': offsets,
+        'datetime': column('datetime', 'datetime64[s]'),
+        'value': column('value', float),
+        'flag': column('flag', np.int8),
+        'texts': [i.text for i in events],
+        'extras': [i.extra for i in events],
+        }
+
+
+def load_series(dumped: dict, namespace: str) -> list[TimeSerie]:
+    '''TimeSerie objects of dump_series'''
+    timeseries = []
+    offsets = dumped['offsets']
+    for i, fields in enumerate(dumped['headers']):
+        header = Header(*fields)
+        rows = slice(offsets[i], offsets[i + 1])
+        value = dumped['value'][rows].astype(dumped['dtypes'][i], copy=False)
+        events = Events(dumped['datetime'][rows], value, dumped['flag'][rows], header.missVal,
+                        dumped['texts'][i], dumped['extras'][i])
+        timeseries.append(TimeSerie.from_parsed(header, events, namespace))
+    return timeseries
+
+
+class ParseCache:
+    '''
+    Parsed series of PI-XML files, stored in a cache folder.
+
+    Each PI-XML file has one entry holding its header fields and event
+    columns. An entry is used when the path, mtime and size of the file
+    and its PI binary companion are unchanged, or else when their content
+    hash is unchanged. The least recently used entries are removed when
+    the folder exceeds maxsize bytes.
+    '''
+    def __init__(self, folder: Path, maxsize: int = CACHE_MAXSIZE) -> None:
+        self.folder = Path(folder)
+        self.maxsize = maxsize
+
+    def entry_path(self, xmlfilepath: Path) -> Path:
+        name = hashlib.sha256(str(Path(xmlfilepath).resolve()).encode()).hexdigest()
+        return self.folder / f'{name[:32]}.pixml'
+
+    @staticmethod
+    def file_key(xmlfilepath: Path, namespace: str) -> dict:
+        filepaths = [xmlfilepath, bin_path(xmlfilepath)]
+        stats = [i.stat() for i in filepaths if i is not None]
+        return {'version': CACHE_VERSION, 'namespace': namespace,
+                'path': str(xmlfilepath.resolve()),
+                'mtime_ns': [i.st_mtime_ns for i in stats], 'size': [i.st_size for i in stats]}
+
+    @staticmethod
+    def content_hash(xmlfilepath: Path) -> str:
+        binfilepath = bin_path(xmlfilepath)
+        if binfilepath is None:
+            return file_hash(xmlfilepath)
+        return f'{file_hash(xmlfilepath)}:{file_hash(binfilepath)}'
+
+    def load(self, xmlfilepath: Path, namespace: str) -> list[TimeSerie]:
+        '''parsed series of xmlfilepath, None when there is no valid entry'''
+        entry = self.entry_path(xmlfilepath)
+        try:
+            with open(entry, 'rb') as fr:
+                cached = pickle.load(fr)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+        key = self.file_key(xmlfilepath, namespace)
+
+        def matches(*fields):
+            return all(cached['key'].get(i) == key[i] for i in fields)
+
+        if not matches('version', 'namespace', 'path'):
+            return None
+
+        if matches('mtime_ns', 'size'):
+            # mark as recently used
+            os.utime(entry)
+        elif matches('size') and cached['key'].get('sha256') == self.content_hash(xmlfilepath):
+            # touched or copied, the content is unchanged
+            cached['key'] = {**key, 'sha256': cached['key']['sha256']}
+            self.write(entry, cached)
+        else:
+            return None
+
+        logger.debug(f'Loaded {xmlfilepath.name} from parse cache')
+        return load_series(cached['series'], namespace)
+
+    def store(self, xmlfilepath: Path, namespace: str, timeseries: list[TimeSerie]) -> None:
+        '''add the parsed series of xmlfilepath and evict the least recently used entries'''
+        key = {**self.file_key(xmlfilepath, namespace), 'sha256': self.content_hash(xmlfilepath)}
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.write(self.entry_path(xmlfilepath), {'key': key, 'series': dump_series(timeseries)})
+        self.evict()
+
+    def write(self, entry: Path, cached: dict) -> None:
+        tmpfile = entry.with_name(f'.{entry.name}.tmp')
+        try:
+            with open(tmpfile, 'wb') as fw:
+                pickle.dump(cached, fw, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpfile, entry)
+        except OSError as e:
+            logger.debug(f'Parse cache entry not written: {e}')
+
+    def evict(self) -> None:
+        '''remove the least recently used entries until the folder fits maxsize'''
+        entries = []
+        for entry in self.folder.glob('*.pixml'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry))
+
+        size = sum(i[1] for i in entries)
+        for _, entry_size, entry in sorted(entries, key=lambda x: x[0]):
+            if size <= self.maxsize:
+                break
+            entry.unlink(missing_ok=True)
+            size -= entry_size
+            logger.debug(f'Evicted {entry.name} from parse cache')
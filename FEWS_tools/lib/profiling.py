@@ -0,0 +1,146 @@
+import sys
+import json
+import time
+import tracemalloc
+import datetime as dt
+from pathlib import Path
+from contextlib import contextmanager
+
+
+class Stage:
+    '''
+    Accumulated measurements of a named stage.
+
+    Wall and CPU time are summed over all calls, peak_memory is the
+    highest memory traced by tracemalloc during any call in bytes, or
+    None when memory is not traced.
+    Items are counts added by the stage, e.g. series, rows or files.
+    '''
+    __slots__ = ('calls', 'wall', 'cpu', 'peak_memory', 'items')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall = 0.
+        self.cpu = 0.
+        self.peak_memory = None
+        self.items = {}
+
+    def add(self, **items: int) -> None:
+        for key, n in items.items():
+            self.items[key] = self.items.get(key, 0) + n
+
+    def to_dict(self) -> dict:
+        return {i: getattr(self, i) for i in self.__slots__}
+
+
+class Profiler:
+    '''
+    Records wall time, CPU time, peak memory and item counts by stage.
+
+    A disabled profiler yields a Stage that is not recorded, so stages can
+    be instrumented unconditionally. CPU time and memory are those of the
+    current process, work done in worker processes is only part of the wall
+    time of the stage that waits for it.
+
+    Peak memory by stage is only traced with trace_memory. tracemalloc
+    slows down allocations several times, so the times of a traced run
+    include its overhead and are not comparable to an untraced run.
+    '''
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.tracing = False
+        self.reset()
+
+    def reset(self) -> None:
+        self.stages = {}
+        self.started = None
+        self._peaks = []
+
+    def enable(self, trace_memory: bool = False) -> None:
+        self.reset()
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.started = time.perf_counter(), dt.datetime.now()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Stage:
+        if not self.enabled:
+            yield Stage()
+            return
+
+        stage = self.stages.setdefault(name, Stage())
+        if not self.trace_memory:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                yield stage
+            finally:
+                stage.calls += 1
+                stage.wall += time.perf_counter() - wall
+                stage.cpu += time.process_time() - cpu
+            return
+
+        # tracemalloc keeps a single peak, the peak of an enclosing stage is kept aside
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            stage.calls += 1
+            stage.wall += time.perf_counter() - wall
+            stage.cpu += time.process_time() - cpu
+
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            stage.peak_memory = max(stage.peak_memory or 0, peak)
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def report(self, **info) -> dict:
+        '''measurements as dict, info is added to the top level'''
+        report = dict(info)
+        if self.started is not None:
+            report['started'] = self.started[1].isoformat(timespec='seconds')
+            report['wall'] = time.perf_counter() - self.started[0]
+        report['peak_rss'] = peak_rss()
+        # times of a traced run include the tracemalloc overhead
+        report['trace_memory'] = self.trace_memory
+        report['stages'] = {name: stage.to_dict() for name, stage in self.stages.items()}
+        return report
+
+    def write(self, filepath: Path, **info) -> None:
+        with open(filepath, 'w') as fw:
+            json.dump(self.report(**info), fw, indent=1)
+
+
+def peak_rss() -> int:
+    '''peak resident set size of the process in bytes, None where unavailable'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def report_path(logfile: Path = None) -> Path:
+    '''profile report next to the logfile, or in the working directory'''
+    if logfile is None:
+        return Path('FEWS_tools.profile.json')
+    return logfile.with_name(f'{logfile.stem}.profile.json')
+
+
+# shared by the scripts, enabled from main.py with --profile
+profiler = Profiler()
@@ -0,0 +1,133 @@
+import copy
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from FEWS_tools import logger
+from FEWS_tools.lib.utils import file_hash
+
+
+# bump when the pickled layout of RuleIndex changes
+CACHE_VERSION = 1
+
+# rule indexes loaded by this process, kept warm in serve mode
+_loaded = {}
+
+
+class Rules:
+    '''
+    DAMO_pomp periods of a single structure, sorted by begin.
+
+    The period bounds are datetime64 arrays, params holds the
+    underlying parameters of each TYPEFORMULE as resolved by the
+    flag mapping, or None when the TYPEFORMULE is not mapped.
+    '''
+    __slots__ = ('begins', 'ends', 'typeformule', 'params')
+
+    def __init__(self, begins: np.ndarray, ends: np.ndarray,
+                 typeformule: list[str], params: list[tuple]) -> None:
+        self.begins = begins
+        self.ends = ends
+        self.typeformule = typeformule
+        self.params = params
+
+    def __len__(self) -> int:
+        return len(self.begins)
+
+    def __repr__(self) -> str:
+        return f'<Rules({len(self)} periods)>'
+
+
+class RuleIndex(dict):
+    '''
+    DAMO_pomp rules keyed by structure CODE.
+
+    The index is built once per DAMO_pomp file and can be pickled,
+    see load_rule_index for the cache that is kept next to the file.
+    '''
+    @classmethod
+    def from_frame(cls, damo_pomp_df: pd.DataFrame, flag_mapping: dict) -> 'RuleIndex':
+        damo_pomp_df = damo_pomp_df.assign(
+            begin=pd.to_datetime(damo_pomp_df.OBJECTBEGI, format='%d-%m-%Y'),
+            end=pd.to_datetime(damo_pomp_df.OBJECTEIND, format='%d-%m-%Y'))
+        damo_pomp_df = damo_pomp_df.sort_values(['CODE', 'begin'], kind='stable')
+
+        index = cls()
+        for code, rules in damo_pomp_df.groupby('CODE', sort=False):
+            typeformule = rules.TYPEFORMULE.tolist()
+            params = [tuple(flag_mapping[i]) if i in flag_mapping else None for i in typeformule]
+            index[code] = Rules(
+                rules.begin.to_numpy(), rules.end.to_numpy(), typeformule, params)
+        return index
+
+    @classmethod
+    def from_file(cls, damo_pomp: Path, flag_mapping: dict) -> 'RuleIndex':
+        return cls.from_frame(pd.read_csv(damo_pomp, sep=';'), flag_mapping)
+
+
+def cache_path(damo_pomp: Path) -> Path:
+    return damo_pomp.with_name(f'.{damo_pomp.name}.ruleindex')
+
+
+def load_rule_index(damo_pomp: Path, flag_mapping: dict, cache: bool = True) -> RuleIndex:
+    '''
+    Load the RuleIndex of a DAMO_pomp file.
+
+    With cache, the index is pickled next to the DAMO_pomp file. The cache
+    is used when the mtime and size are unchanged, or else when the content
+    hash is unchanged. The flag mapping is part of the key as it resolves
+    the params of each rule. Indexes are also kept in memory, which saves
+    reading the cache on repeated calls in serve mode.
+    '''
+    damo_pomp = Path(damo_pomp)
+    if not cache:
+        return RuleIndex.from_file(damo_pomp, flag_mapping)
+
+    stat = damo_pomp.stat()
+    key = {'version': CACHE_VERSION, 'mapping': flag_mapping,
+           'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+    loaded = _loaded.get(damo_pomp.resolve())
+    if loaded is not None and loaded['key'] == key:
+        logger.debug(f'Rule index of {damo_pomp.name} already loaded')
+        return loaded['index']
+
+    index = load_cached(damo_pomp, key)
+    _loaded[damo_pomp.resolve()] = {'key': copy.deepcopy(key), 'index': index}
+    return index
+
+
+def load_cached(damo_pomp: Path, key: dict) -> RuleIndex:
+    '''load_rule_index through the pickle cache next to the DAMO_pomp file'''
+    flag_mapping = key['mapping']
+    cachefile = cache_path(damo_pomp)
+    cached = None
+    try:
+        with open(cachefile, 'rb') as fr:
+            cached = pickle.load(fr)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    def matches(*fields):
+        return cached is not None and all(cached['key'].get(i) == key[i] for i in fields)
+
+    if matches('version', 'mapping', 'mtime_ns', 'size'):
+        logger.debug(f'Loaded rule index of {damo_pomp.name} from cache')
+        return cached['index']
+
+    key = {**key, 'sha256': file_hash(damo_pomp)}
+    if matches('version', 'mapping', 'sha256'):
+        logger.debug(f'Loaded rule index of {damo_pomp.name} from cache, content unchanged')
+        index = cached['index']
+    else:
+        logger.debug(f'Built rule index of {damo_pomp.name}')
+        index = RuleIndex.from_file(damo_pomp, flag_mapping)
+
+    try:
+        with open(cachefile, 'wb') as fw:
+            pickle.dump({'key': key, 'index': index}, fw, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logger.debug(f'Rule index cache not written: {e}')
+    return index
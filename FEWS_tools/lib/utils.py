@@ -1,3 +1,7 @@
+import hashlib
+from pathlib import Path
+
+
 def ns(tag, namespace=None):
     '''
     Prepend {namespace} to tag
@@ -15,3 +19,29 @@ def add_loghandler(logger, handler, loglevel, formatter, **kwargs):
     handler.setLevel(loglevel)
     handler.setFormatter(formatter)
     logger.addHandler(handler)
+    return handler
+
+
+def file_hash(filepath, size=None, start=0):
+    '''
+    sha256 hexdigest of a file, or of its bytes from start up to size
+    '''
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as fr:
+        fr.seek(start)
+        remaining = float('inf') if size is None else size - start
+        while remaining > 0:
+            block = fr.read(int(min(2**20, remaining)))
+            if not block:
+                break
+            sha256.update(block)
+            remaining -= len(block)
+    return sha256.hexdigest()
+
+
+def bin_path(xmlfilepath):
+    '''
+    PI binary companion of a PI-XML file, None when there is none
+    '''
+    binfilepath = Path(xmlfilepath).with_suffix('.bin')
+    return binfilepath if binfilepath.exists() else None
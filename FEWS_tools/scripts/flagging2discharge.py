@@ -1,10 +1,19 @@
+import io
+import os
 import re
-import datetime as dt
+import csv
+import json
+import hashlib
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
 from FEWS_tools import logger
+from FEWS_tools.lib.rules import Rules, load_rule_index
+from FEWS_tools.lib.utils import file_hash
+from FEWS_tools.lib.profiling import profiler
 
 
 FLAG_MAPPING = {
@@ -21,9 +30,38 @@ FLAG_MAPPING = {
         },
     }
 
+# format of the date column written by convert_pixml2csv
+DATE_FORMAT = '%Y-%m-%d'
 
-def str_to_datetime(date, fmt='%d-%m-%Y'):
-    return dt.datetime.strptime(date, fmt)
+# sidecar file in the output folder with the incremental state per file
+STATE_FILE = '.flagging2discharge.json'
+
+# bytes before the processed size of a file that are hashed to validate its state
+STATE_TAIL = 2**20
+
+
+def read_table(filepath: Path, file_format: str = 'csv') -> pd.DataFrame:
+    '''read output of convert_pixml2csv, parquet and feather keep their dtypes'''
+    if file_format == 'parquet':
+        return pd.read_parquet(filepath)
+    if file_format == 'feather':
+        return pd.read_feather(filepath)
+    return parse_dates(pd.read_csv(filepath))
+
+
+def parse_dates(df: pd.DataFrame) -> pd.DataFrame:
+    '''date column of a csv to datetime64 inplace, in the fixed format of convert_pixml2csv'''
+    df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+    return df
+
+
+def write_table(df: pd.DataFrame, filepath: Path, file_format: str = 'csv') -> None:
+    if file_format == 'parquet':
+        df.to_parquet(filepath, index=False)
+    elif file_format == 'feather':
+        df.to_feather(filepath)
+    else:
+        df.to_csv(filepath, index=False, na_rep='NaN')
 
 
 def flag_colname(subloc, param, dtres, suffix=''):
@@ -33,7 +71,314 @@ def flag_colname(subloc, param, dtres, suffix=''):
     return f'flag_{subloc}_{param}.{dtres}{suffix}'
 
 
-def update_flagging(basename: Path, damo_pomp: Path, output_folder: Path=None):
+def period_mask(dates: np.ndarray, begins: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    '''
+    Boolean mask of dates within any [begin, end) period.
+
+    The periods are located in the sorted dates with searchsorted
+    and combined through a cumulative sum over their boundaries.
+    '''
+    order = None
+    if not np.all(dates[1:] >= dates[:-1]):
+        order = np.argsort(dates, kind='stable')
+        dates = dates[order]
+
+    starts = np.searchsorted(dates, begins, side='left')
+    stops = np.searchsorted(dates, ends, side='left')
+    valid = starts < stops
+
+    boundaries = np.zeros(len(dates) + 1, dtype=np.int64)
+    np.add.at(boundaries, starts[valid], 1)
+    np.add.at(boundaries, stops[valid], -1)
+    mask = np.cumsum(boundaries[:-1]) > 0
+
+    if order is not None:
+        unsorted = np.empty_like(mask)
+        unsorted[order] = mask
+        return unsorted
+    return mask
+
+
+def apply_rules(csv_in: pd.DataFrame, rules: Rules, subloc: str, dtres: str) -> list[str]:
+    '''
+    Update the discharge flag of csv_in inplace for all periods in rules.
+
+    Returns a warning for every period that is skipped.
+    '''
+    return format_skipped(rules, apply_rule_groups(csv_in, rules, subloc, dtres))
+
+
+def apply_rule_groups(csv_in: pd.DataFrame, rules: Rules, subloc: str, dtres: str) -> dict:
+    '''
+    Rules with the same underlying columns are applied in a single pass over
+    the union of their periods. The discharge flag is part of every column
+    set, so the result equals applying the rules one by one.
+
+    Returns the missing columns and number of skipped rows by rule.
+    '''
+    flag_discharge_col = flag_colname(subloc, 'Q.B', dtres)
+    dates = csv_in['date'].to_numpy()
+    begins, ends = rules.begins, rules.ends
+
+    # group rules by identical column sets, in order of first appearance
+    skipped = {}
+    column_groups = {}
+    for i, params in enumerate(rules.params):
+        if params is None:
+            raise KeyError(rules.typeformule[i])
+        flag_underlying_cols = [flag_colname(subloc, param, dtres) for param in params]
+
+        # The discharge flag itself is used in comparison
+        flag_underlying_cols += [flag_discharge_col]
+        column_groups.setdefault(tuple(flag_underlying_cols), []).append(i)
+
+    for flag_underlying_cols, group in column_groups.items():
+        # abort update if any column not present
+        column_not_found = set(flag_underlying_cols) - set(csv_in.columns)
+        if column_not_found:
+            for i in group:
+                indexer = (begins[i] <= dates) & (dates < ends[i])
+                skipped[i] = (column_not_found, int(indexer.sum()))
+            continue
+
+        # update flagging for all periods w.r.t. underlying series
+        # the existing discharge flag is updated inplace
+        indexer = period_mask(dates, begins[group], ends[group])
+        csv_in.loc[indexer, flag_discharge_col] = csv_in.loc[
+            indexer, list(flag_underlying_cols)].max(axis=1)
+
+    return skipped
+
+
+def format_skipped(rules: Rules, skipped: dict) -> list[str]:
+    return [f'''{column_not_found} not found, skipping {n} '''
+            f'''rows between {pd.Timestamp(rules.begins[i])} & {pd.Timestamp(rules.ends[i])}'''
+            for i, (column_not_found, n) in skipped.items()]
+
+
+def common_dtype(a, b):
+    '''dtype that holds a column inferred as a in one chunk and b in another'''
+    if a == b:
+        return a
+    if isinstance(a, np.dtype) and isinstance(b, np.dtype):
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+def update_chunked(file: Path, subloc: str, dtres: str, rules: Rules,
+                   outputfilepath: Path, chunksize: int) -> tuple[list[str], pd.DataFrame]:
+    '''
+    Update flagging of a csv in chunks of chunksize rows.
+
+    The first pass determines the dtypes of the updated columns over all
+    chunks, the second pass writes the chunks in these dtypes to a temporary
+    file that replaces the output. Memory is bounded by the chunksize and the
+    output equals a full update.
+
+    Returns the warnings of apply_rules and the last chunk as written.
+    '''
+    read_chunks = lambda: map(parse_dates, pd.read_csv(file, chunksize=chunksize))
+
+    skipped = {}
+    dtypes = {}
+    for chunk in read_chunks():
+        for i, (column_not_found, n) in apply_rule_groups(chunk, rules, subloc, dtres).items():
+            skipped[i] = (column_not_found, skipped.get(i, (None, 0))[1] + n)
+        for column, dtype in chunk.dtypes.items():
+            dtypes[column] = common_dtype(dtypes.get(column, dtype), dtype)
+
+    tmp = outputfilepath.with_name(f'.{outputfilepath.name}.tmp')
+    try:
+        with open(tmp, 'w', newline='') as fw:
+            for i, chunk in enumerate(read_chunks()):
+                apply_rule_groups(chunk, rules, subloc, dtres)
+                chunk = chunk.astype(dtypes)
+                chunk.to_csv(fw, header=i == 0, index=False, na_rep='NaN')
+        os.replace(tmp, outputfilepath)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return format_skipped(rules, skipped), chunk
+
+
+def update_file(file: Path, subloc: str, dtres: str, rules: Rules, output_folder: Path,
+                file_format: str = 'csv', rules_key: str = None, state: dict = None,
+                chunksize: int = None) -> tuple[Path, list[str], dict]:
+    '''
+    Update flagging of a single file - used as task in a process pool.
+
+    With a rules_key the update is incremental, rows appended since the
+    recorded state are flagged and appended to the output. A full update
+    is done when there is no valid state, see append_rows.
+    With a chunksize, csv files are updated in chunks, see update_chunked.
+
+    Returns the written file, the warnings of apply_rules and the new state.
+    '''
+    outputfilepath = output_folder / f'{file.name}'
+
+    warnings = None
+    if rules_key is not None and has_valid_state(file, outputfilepath, rules_key, state):
+        with profiler.stage('append'):
+            warnings, last = append_rows(file, subloc, dtres, rules, outputfilepath, state)
+
+    if warnings is None:
+        if chunksize and file_format == 'csv':
+            with profiler.stage('chunked'):
+                warnings, csv_in = update_chunked(
+                    file, subloc, dtres, rules, outputfilepath, chunksize)
+        else:
+            with profiler.stage('read') as stage:
+                csv_in = read_table(file, file_format)
+                stage.add(rows=len(csv_in))
+            with profiler.stage('apply'):
+                warnings = apply_rules(csv_in, rules, subloc, dtres)
+            with profiler.stage('write'):
+                write_table(csv_in, outputfilepath, file_format)
+
+        if rules_key is None:
+            return outputfilepath, warnings, None
+        last = f'{csv_in.date.iloc[-1]:%Y-%m-%d} {csv_in.time.iloc[-1]}' if len(csv_in) else None
+        dtypes = {column: str(dtype) for column, dtype in csv_in.dtypes.items()}
+    else:
+        dtypes = state['dtypes']
+
+    stat = file.stat()
+    state = {'rules': rules_key, 'input_size': stat.st_size, 'input_mtime_ns': stat.st_mtime_ns,
+             'input_tail_sha256': file_hash(file, stat.st_size, tail_start(stat.st_size)),
+             'output_size': outputfilepath.stat().st_size, 'last': last, 'dtypes': dtypes}
+    return outputfilepath, warnings, state
+
+
+def tail_start(size: int) -> int:
+    '''start of the bytes before size that are hashed to validate a state'''
+    return max(0, size - STATE_TAIL)
+
+
+def has_valid_state(file: Path, outputfilepath: Path, rules_key: str, state: dict) -> bool:
+    '''
+    The state is valid when DAMO_pomp is unchanged, the output is as written
+    by the previous update and the input only has rows appended since.
+    Inplace updates are covered by the input check alone.
+
+    The input is not read when its size and mtime are as recorded, else
+    the last STATE_TAIL bytes of the processed part are hashed. Exports
+    change converted files at their end, see append_csv, changes to
+    earlier rows alone are not detected. States of earlier versions hold
+    a hash of the whole processed part, which is checked instead.
+    '''
+    if state is None or state['rules'] != rules_key or 'dtypes' not in state:
+        return False
+    if outputfilepath != file and (
+            not outputfilepath.exists() or outputfilepath.stat().st_size != state['output_size']):
+        return False
+    stat = file.stat()
+    if stat.st_size < state['input_size']:
+        return False
+    if stat.st_size == state['input_size'] and stat.st_mtime_ns == state.get('input_mtime_ns'):
+        return True
+    if 'input_tail_sha256' not in state:
+        return file_hash(file, state['input_size']) == state.get('input_sha256')
+    return file_hash(file, state['input_size'], tail_start(state['input_size'])) == \
+        state['input_tail_sha256']
+
+
+def output_dtypes(df: pd.DataFrame, dtypes: dict) -> dict:
+    '''
+    dtypes of the columns of df as written by a full update, given the
+    dtypes of the earlier rows. None when a column of df needs another
+    dtype than the earlier rows, their formatting would change.
+    '''
+    if list(df.columns) != list(dtypes):
+        return None
+    for column, dtype in df.dtypes.items():
+        if str(dtype) != dtypes[column] and not (
+                dtypes[column] == 'float64' and dtype.kind in 'iu'):
+            return None
+    return dtypes
+
+
+def append_rows(file: Path, subloc: str, dtres: str, rules: Rules,
+                outputfilepath: Path, state: dict) -> tuple[list[str], str]:
+    '''
+    Flag the rows appended to file since state and append them to the output.
+
+    The new rows are written in the dtypes of the earlier rows, so the
+    output equals a full update. Returns the warnings of apply_rules and
+    the last timestamp, or None for both when the new rows do not start
+    after the last processed timestamp or need other dtypes, and a full
+    update is required.
+    '''
+    with open(file, 'rb') as fr:
+        header = fr.readline()
+        fr.seek(state['input_size'])
+        data = fr.read()
+
+    if not data:
+        return [], state['last']
+
+    columns = next(csv.reader([header.decode()]))
+    rows = parse_dates(pd.read_csv(io.BytesIO(data), names=columns, header=None))
+
+    first = f'{rows.date.iloc[0]:%Y-%m-%d} {rows.time.iloc[0]}'
+    if state['last'] is not None and first <= state['last']:
+        logger.debug(f'Rows of {file.name} changed before {state["last"]}, full update')
+        return None, None
+
+    warnings = apply_rules(rows, rules, subloc, dtres)
+    dtypes = output_dtypes(rows, state['dtypes'])
+    if dtypes is None:
+        logger.debug(f'Column types of {file.name} changed, full update')
+        return None, None
+
+    # inplace updates replace the unflagged rows, else the output is extended
+    chunk = rows.astype(dtypes).to_csv(header=False, index=False, na_rep='NaN').encode()
+    with open(outputfilepath, 'r+b') as fw:
+        fw.seek(state['output_size'])
+        fw.write(chunk)
+        fw.truncate()
+
+    logger.debug(f'Appended {len(rows)} row(s) to {outputfilepath.name}')
+    return warnings, f'{rows.date.iloc[-1]:%Y-%m-%d} {rows.time.iloc[-1]}'
+
+
+def load_state(output_folder: Path) -> dict:
+    try:
+        with open(output_folder / STATE_FILE) as fr:
+            return json.load(fr)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(output_folder: Path, state: dict) -> None:
+    statefile = output_folder / STATE_FILE
+    with open(statefile.with_suffix('.tmp'), 'w') as fw:
+        json.dump(state, fw, indent=1)
+    os.replace(statefile.with_suffix('.tmp'), statefile)
+
+
+def log_update(outputfilepath: Path, warnings: list[str]) -> int:
+    '''log result of update_file, returns the number of skipped periods'''
+    for warning in warnings:
+        logger.warning(warning)
+    logger.info(f'Updated {outputfilepath}')
+    return len(warnings)
+
+
+def file_pattern(file_format: str = 'csv') -> re.Pattern:
+    '''
+    pattern of the files to update, these are output from convert_pixml2csv
+
+    The pattern is anchored at the end, temporary files such as those of
+    update_chunked, .{name}.tmp, do not match.
+    '''
+    return re.compile(
+        r'''.*_(?P<subloc>H|P[0-9]*|VL[0-9]*)_'''
+        r'''(?P<dtres>T[0-9]+)_(?P<slcode>SL[0-9]{6})\.''' + re.escape(file_format) + r'\Z')
+
+
+def update_flagging(basename: Path, damo_pomp: Path, output_folder: Path=None,
+                    file_format: str = 'csv', workers: int = 1, cache_rules: bool = True,
+                    incremental: bool = False, chunksize: int = None):
     '''
     Update dischage flagging with flagging of underlying series
 
@@ -44,57 +389,83 @@ def update_flagging(basename: Path, damo_pomp: Path, output_folder: Path=None):
     input files shoud have a specific pattern (see regex)
     damo_pomp is a file that defined periods and rules for discharge calculations.
     output_folder if specified, files are written here and not overwritten
+    file_format is the format written by convert_pixml2csv: csv, parquet or feather
+    workers is the number of processes to update files with. DAMO_pomp is read once,
+    each task receives the rules of its structure only.
+    cache_rules keeps the parsed DAMO_pomp rules next to the file, see load_rule_index.
+    incremental only flags rows appended since the previous run, the state per file is
+    kept in STATE_FILE in the output_folder. Files are fully updated when DAMO_pomp
+    or earlier rows changed, or the appended rows change the type of a column.
+    Only csv is updated incrementally.
+    chunksize streams csv files in chunks of rows to bound memory, see update_chunked.
     '''
-    # file pattern to match, this is output from convert_pixml2csv
-    pattern = r'''.*_(?P<subloc>H|P[0-9]*|VL[0-9]*)_'''\
-              r'''(?P<dtres>T[0-9]+)_(?P<slcode>SL[0-9]{6})\.csv'''
-    pattern = re.compile(pattern)
+    update_files(list(basename.iterdir()), damo_pomp, output_folder or basename, file_format,
+                 workers, cache_rules, incremental, chunksize)
+
+
+def update_files(files: list[Path], damo_pomp: Path, output_folder: Path,
+                 file_format: str = 'csv', workers: int = 1, cache_rules: bool = True,
+                 incremental: bool = False, chunksize: int = None) -> list[Path]:
+    '''update_flagging of the files matching file_pattern, returns the written files'''
+    pattern = file_pattern(file_format)
 
-    damo_pomp_df = pd.read_csv(damo_pomp, sep=';')
-    output_folder = output_folder or basename
+    with profiler.stage('rules') as stage:
+        rule_index = load_rule_index(damo_pomp, FLAG_MAPPING['DAMO_pomp'], cache_rules)
+        stage.add(structures=len(rule_index))
 
-    for file in basename.iterdir():
+    # DAMO_pomp and flag mapping identify the rules applied to a file
+    rules_key = state = None
+    if incremental and file_format != 'csv':
+        logger.warning(f'Incremental update not supported for {file_format}, full update')
+    elif incremental:
+        rules_key = hashlib.sha256(
+            (file_hash(damo_pomp) + repr(FLAG_MAPPING['DAMO_pomp'])).encode()).hexdigest()
+        state = load_state(output_folder)
+
+    if chunksize and file_format != 'csv':
+        logger.warning(f'Chunked update not supported for {file_format}, full update')
+
+    tasks = []
+    not_found = 0
+    for file in files:
         # select pattern matching files
-        match = re.match(pattern, file.name)
+        match = pattern.match(file.name)
         if match:
             logger.debug(f'Update flagging for: {file.name}')
-            csv_in = pd.read_csv(file, parse_dates=['date'])
 
-            # parse filepattern, get discharge flag col, select rules
+            # parse filepattern, select rules
             subloc, dtres, slcode = match.groups()
-            flag_discharge_col = flag_colname(subloc, 'Q.B', dtres[1:])
-            flag_rules = damo_pomp_df[damo_pomp_df.CODE == slcode]
-
-            if not flag_rules.empty:
-                for rule in flag_rules.itertuples():
-                    # select columns for specific period
-                    params = FLAG_MAPPING['DAMO_pomp'][rule.TYPEFORMULE]
-                    flag_underlying_cols = [
-                        flag_colname(subloc, param, dtres[1:]) for param in params]
-
-                    # The discharge flag itself is used in comparison
-                    flag_underlying_cols += [flag_discharge_col]
-
-                    # select specific period to update
-                    start_period = str_to_datetime(rule.OBJECTBEGI)
-                    end_period = str_to_datetime(rule.OBJECTEIND)
-                    indexer = (start_period <= csv_in.date) & (csv_in.date < end_period)
-
-                    # abort update if any column not present
-                    column_not_found = set(flag_underlying_cols) - set(csv_in.columns)
-                    if column_not_found:
-                        logger.warning(
-                            f'''{column_not_found} not found, skipping {indexer.sum()} '''
-                            f'''rows between {start_period} & {end_period}''')
-                        continue
-
-                    # update flagging for specific period w.r.t. underlying series
-                    # the existing discharge flag is updated inplace
-                    csv_in.loc[indexer, flag_discharge_col] = csv_in.loc[
-                        indexer, flag_underlying_cols].max(axis=1)
-
-                outputfilepath = output_folder / f'{file.name}'
-                csv_in.to_csv(outputfilepath, index=False, na_rep='NaN')
-                logger.info(f'Updated {outputfilepath}')
+            rules = rule_index.get(slcode)
+
+            if rules is not None:
+                tasks.append((file, subloc, dtres[1:], rules, output_folder, file_format,
+                              rules_key, None if state is None else state.get(file.name),
+                              chunksize))
             else:
+                not_found += 1
                 logger.warning(f'{slcode} not found in {damo_pomp} for {file}')
+
+    # update files, results are logged in file order
+    with profiler.stage('update') as stage:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+                futures = [executor.submit(update_file, *task) for task in tasks]
+                results = [future.result() for future in futures]
+        else:
+            results = [update_file(*task) for task in tasks]
+        stage.add(files=len(tasks))
+
+    skipped = 0
+    for task, (outputfilepath, warnings, file_state) in zip(tasks, results):
+        skipped += log_update(outputfilepath, warnings)
+        if state is not None:
+            state[task[0].name] = file_state
+
+    if state is not None:
+        save_state(output_folder, state)
+
+    logger.info(
+        f'''Updated {len(tasks)} file(s), {not_found} file(s) not in DAMO_pomp, '''
+        f'''{skipped} period(s) skipped''')
+    return [i[0] for i in results]
+
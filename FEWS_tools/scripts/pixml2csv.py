@@ -1,61 +1,408 @@
 """
-Read PI-XML and convert to CSV
+Read PI-XML and convert to CSV, Parquet or Feather
 """
 
+import os
 import csv
 import fnmatch
-import copy as cp
+import importlib.util
 import itertools as it
+import collections
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 
 from FEWS_tools import logger
-from FEWS_tools.lib.utils import ns
-from FEWS_tools.lib.models import TimeSerie
+from FEWS_tools.lib.utils import ns, bin_path
+from FEWS_tools.lib.dtypes import deduplicate
+from FEWS_tools.lib.profiling import profiler
+from FEWS_tools.lib.models import MISSING_FLAG, NO_FLAG, Events, Header, TimeSerie, format_times
+from FEWS_tools.lib.parsecache import CACHE_MAXSIZE, ParseCache
+
+
+# number of rows serialized per write
+CHUNKSIZE = 100_000
+
+# PI-XML parser backends, lxml is optional
+PARSERS = ('auto', 'lxml', 'etree')
+
+# namespace of PI-XML exports
+NAMESPACE = "http://www.wldelft.nl/fews/PI"
 
+# bytes read per step when reading an existing csv backwards
+TAIL_BLOCKSIZE = 2**16
 
-def events_to_csv(events, filepath):
+# values of PI binary files, little-endian float32
+BIN_DTYPE = np.dtype('<f4')
+
+# writer threads and the number of joined tables waiting to be written, see write_pipelined
+WRITER_THREADS = 2
+PIPELINE_MAXSIZE = 4
+
+
+def events_to_csv(table, filepath, chunksize=None):
+    '''
+    Write EventTable to csv.
+
+    The rows are serialized from the columnar arrays in chunks,
+    each chunk is joined to a single string and written at once.
+    '''
     with open(filepath, 'w', newline='') as fw:
-        columns = events[0].keys()
-        writer = csv.DictWriter(fw, columns)
-        writer.writeheader()
-        writer.writerows(events)
+        csv.writer(fw).writerow(table.columns)
+        for chunk in table.iter_csv(chunksize or CHUNKSIZE):
+            fw.write(chunk)
 
 
-def convert_pixml2csv(
-        basename, xmlfilepattern, output_folder=None, join_events=True, H_to_SL=False):
+def read_tail(filepath, since):
     '''
-    Convert pixml to csv - this function can be called from within FEWS.
+    Header and trailing rows of a csv written by events_to_csv.
 
-    The basename is the directory where the exported xmlfile(s) are located.
-    The xmlfilepattern matches the exported PIXML-file(s) by FEWS.
-    The basename is used when the output_folder is not specified.
-    The join_events argument specifies whether equidistant series
-    should written to the same file.
+    The file is read backwards from the end in blocks until a row before
+    since is found, since is a b'YYYY-MM-DD,HH:MM:SS' timestamp. Returns the
+    header line, the byte offset of the first row at or after since and the
+    rows from there on.
+    '''
+    with open(filepath, 'rb') as fr:
+        header = fr.readline()
+        start = fr.tell()
+        end = position = fr.seek(0, os.SEEK_END)
 
-    The resulting csvfiles are stripped from duplicates and empty series.
+        buffer = b''
+        rows = []
+        while position > start:
+            read_from = max(start, position - TAIL_BLOCKSIZE)
+            fr.seek(read_from)
+            buffer = fr.read(position - read_from) + buffer
+            position = read_from
+
+            # the first line is incomplete unless the header is reached
+            rows = buffer.splitlines(keepends=True)
+            if position > start:
+                rows = rows[1:]
+            if rows and rows[0][:19] < since:
+                break
+
+    # rows are sorted by timestamp
+    skip = 0
+    while skip < len(rows) and rows[skip][:19] < since:
+        skip += 1
+    rows = rows[skip:]
+    return header, end - sum(map(len, rows)), rows
+
+
+def append_csv(table, filepath, chunksize=None):
     '''
-    output_folder = output_folder or basename
-    namespace = "http://www.wldelft.nl/fews/PI"
+    Update a csv written by events_to_csv with the rows of EventTable.
 
-    timeseries = []
-    for xmlfilepath in basename.iterdir():
-        if fnmatch.fnmatch(xmlfilepath.name, xmlfilepattern):
-            # parse xmlfile
-            tree = ET.parse(xmlfilepath)
-            root = tree.getroot()
+    Rows of the table after the last row in the file are appended. Where
+    the table overlaps the file, the file is kept up to the first changed
+    row and rewritten from there with the table, so the export overrules
+    the file for its period. Rows are compared by value, see same_row.
+    Columns are matched by name, a file with other columns is merged with
+    the table, see merge_csv. A file the table does not change is not
+    written.
+    '''
+    if not filepath.exists() or not len(table):
+        return events_to_csv(table, filepath, chunksize)
 
-            # parse and convert serie tag to TimeSerie
-            for serie in root.iter(ns('series', namespace)):
-                timeseries.append(TimeSerie(serie, namespace))
-                logger.debug(f'Successfully parsed {xmlfilepath.name}')
+    since = format_key(table.datetime[0])
+    header, offset, rows = read_tail(filepath, since)
+    lineterminator = '\r\n' if header.endswith(b'\r\n') else '\n'
+    columns = next(csv.reader([header.decode()]), [])
+    if columns != table.columns:
+        reordered = table.reorder(columns)
+        if reordered is None:
+            return merge_csv(table, filepath, columns, lineterminator, chunksize)
+        table = reordered
+
+    # compare the overlapping rows, rewrite from the first difference
+    overlap = 0
+    if rows:
+        last = np.datetime64(rows[-1][:19].decode().replace(',', 'T'))
+        n_overlap = np.searchsorted(table.datetime, last, side='right')
+        new_rows = ''.join(table.select(slice(0, n_overlap)).iter_csv(
+            max(n_overlap, 1), lineterminator)).encode().splitlines(keepends=True)
+        for row, new_row in zip(rows, new_rows):
+            if row != new_row and not same_row(row, new_row):
+                break
+            offset += len(row)
+            overlap += 1
+
+    if overlap == len(table) == len(rows):
+        logger.debug(f'{filepath.name}: unchanged')
+        return
+    logger.debug(
+        f'{filepath.name}: kept {overlap} overlapping row(s), writing {len(table) - overlap}')
+    with open(filepath, 'r+b') as fw:
+        fw.seek(offset)
+        fw.truncate()
+        for chunk in table.select(slice(overlap, None)).iter_csv(
+                chunksize or CHUNKSIZE, lineterminator):
+            fw.write(chunk.encode())
+
+
+def merge_csv(table, filepath, columns, lineterminator='\r\n', chunksize=None):
+    '''
+    Rewrite a csv with other columns than EventTable, rows before the table are kept.
+
+    The kept rows are matched to the table columns by name. Series new to
+    the file are filled with their missVal and MISSING_FLAG, columns that
+    are not in the table are dropped.
+    '''
+    fill = {}
+    for (value_label, flag_label), missVal in zip(table.labels, table.missVals):
+        fill[value_label], fill[flag_label] = missVal, str(MISSING_FLAG)
+    positions = {name: i for i, name in enumerate(columns)}
+    take = [(positions.get(i), fill.get(i, '')) for i in table.columns[2:]]
+    logger.warning(
+        f'Columns of {filepath.name} changed, added {sorted(set(table.columns) - set(columns))} '
+        f'and dropped {sorted(set(columns) - set(table.columns))}')
+
+    since = format_key(table.datetime[0]).decode()
+    tmpfile = filepath.with_name(f'.{filepath.name}.tmp')
+    with open(filepath, newline='') as fr, open(tmpfile, 'w', newline='') as fw:
+        reader = csv.reader(fr)
+        next(reader, None)
+        writer = csv.writer(fw, lineterminator=lineterminator)
+        writer.writerow(table.columns)
+        for row in reader:
+            if not row:
+                continue
+            if f'{row[0]},{row[1]}' >= since:
+                break
+            writer.writerow(
+                [row[0], row[1], *(default if i is None else row[i] for i, default in take)])
+        for chunk in table.iter_csv(chunksize or CHUNKSIZE, lineterminator):
+            fw.write(chunk)
+    os.replace(tmpfile, filepath)
 
+
+def same_row(row, new_row):
+    '''
+    csv rows with equal fields, numbers compared by value
+
+    A flag update rewrites the file with pandas, which writes 1 as 1.0
+    and an empty flag as NaN.
+    '''
+    fields, new_fields = row.rstrip(b'\r\n').split(b','), new_row.rstrip(b'\r\n').split(b',')
+    if len(fields) != len(new_fields):
+        return False
+    for field, new_field in zip(fields, new_fields):
+        if field != new_field:
+            try:
+                value, new_value = float(field or 'nan'), float(new_field or 'nan')
+            except ValueError:
+                return False
+            if value != new_value and not (np.isnan(value) and np.isnan(new_value)):
+                return False
+    return True
+
+
+def format_key(datetime):
+    '''datetime64 as the leading b'YYYY-MM-DD,HH:MM:SS' of a csv row'''
+    return str(datetime.astype('datetime64[s]')).replace('T', ',').encode()
+
+
+def events_to_frame(table):
+    '''
+    EventTable to a typed DataFrame.
+
+    The date is a datetime64 column as read by flagging2discharge,
+    values are floats with NaN as missing value and flags are int8, a
+    nullable Int8 where events have no flag. Extra attributes are strings.
+    '''
+    import pandas as pd
+
+    frame = {'date': table.datetime.astype('datetime64[D]').astype('datetime64[ns]'),
+             'time': format_times(table.datetime)}
+    for column, (value_label, flag_label) in enumerate(table.labels):
+        frame[value_label] = table.value[:, column]
+        flag = table.flag[:, column]
+        no_flag = flag == NO_FLAG
+        frame[flag_label] = pd.arrays.IntegerArray(flag, no_flag) if no_flag.any() else flag
+    frame.update(table.extra)
+    return pd.DataFrame(frame)
+
+
+def events_to_parquet(table, filepath):
+    events_to_frame(table).to_parquet(filepath, index=False)
+
+
+def events_to_feather(table, filepath):
+    events_to_frame(table).to_feather(filepath)
+
+
+# writer per output format, the format is used as file extension
+WRITERS = {
+    'csv': events_to_csv,
+    'parquet': events_to_parquet,
+    'feather': events_to_feather,
+    }
+
+
+def resolve_parser(parser='auto'):
+    '''parser backend, auto selects lxml when it is installed'''
+    if parser == 'auto':
+        return 'lxml' if importlib.util.find_spec('lxml') else 'etree'
+    if parser not in PARSERS:
+        raise ValueError(f'{parser} is not a valid parser, choose from {PARSERS}')
+    return parser
+
+
+def iter_timeseries(xmlfilepath, namespace, parser='auto'):
+    '''
+    Stream the <series>-tags of a PI-XML file as TimeSerie objects.
+
+    A TimeSerie is built as soon as the end tag of its <series> arrives,
+    after which the subtree is released. Peak memory therefore depends
+    on the largest single series and not on the size of the whole file.
+    The parser is one of PARSERS, see resolve_parser. The values of a
+    PI-XML file with a PI binary companion are read by iter_timeseries_bin.
+    '''
+    binfilepath = bin_path(xmlfilepath)
+    if binfilepath is not None:
+        yield from iter_timeseries_bin(xmlfilepath, binfilepath, namespace, parser)
+        return
+
+    for element in iter_series_elements(xmlfilepath, namespace, parser):
+        yield TimeSerie(element, namespace)
+
+
+def iter_series_elements(xmlfilepath, namespace, parser='auto'):
+    '''yield the <series>-elements of a PI-XML file, each is released after use'''
+    if resolve_parser(parser) == 'lxml':
+        yield from iter_series_elements_lxml(xmlfilepath, namespace)
+        return
+
+    series_tag = ns('series', namespace)
+    context = ET.iterparse(xmlfilepath, events=('start', 'end'))
+
+    # the first start event holds the root element
+    _, root = next(context)
+    for event, element in context:
+        if event == 'end' and element.tag == series_tag:
+            yield element
+
+            # release parsed series, the TimeSerie keeps what it needs
             root.clear()
 
+
+def iter_series_elements_lxml(xmlfilepath, namespace):
+    '''iter_series_elements with lxml, only end events of <series>-tags are reported'''
+    from lxml import etree
+
+    context = etree.iterparse(str(xmlfilepath), events=('end',), tag=ns('series', namespace))
+    for _, element in context:
+        yield element
+
+        # release parsed series and the emptied siblings before it
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def iter_timeseries_bin(xmlfilepath, binfilepath, namespace, parser='auto'):
+    '''
+    Stream the series of a PI-XML file with a PI binary companion.
+
+    The PI-XML file holds the headers, the binary file the float32 values
+    of all series in header order. Each series has a value for every
+    timestep from startDate to endDate. The binary file is memory mapped
+    once, the values of each series are a view of that map. The
+    timestamps are derived from the header.
+    '''
+    size = binfilepath.stat().st_size
+    values = np.memmap(binfilepath, dtype=BIN_DTYPE, mode='r') if size \
+        else np.empty(0, dtype=BIN_DTYPE)
+
+    offset = 0
+    for element in iter_series_elements(xmlfilepath, namespace, parser):
+        header = Header.from_element(element.find(ns('header', namespace)), namespace)
+        if not header.timedelta:
+            raise ValueError(f'{header.stationName} in {xmlfilepath.name}: '
+                             'nonequidistant series cannot be read from a binary file')
+
+        n_values = (header.end_datetime - header.start_datetime) // header.timedelta + 1
+        if offset + n_values > len(values):
+            raise ValueError(f'{binfilepath.name} holds fewer values than its headers')
+
+        value = values[offset:offset + n_values]
+        offset += n_values
+        events = Events.from_values(
+            value, header.start_datetime, header.timedelta, header.missVal)
+        yield TimeSerie.from_parsed(header, events, namespace)
+
+    if offset * BIN_DTYPE.itemsize != size:
+        logger.warning(f'{binfilepath.name} holds more values than its headers')
+
+
+def parse_pixml(xmlfilepath, namespace, parser='auto'):
+    '''parse all series of a PI-XML file - used as task in a process pool'''
+    return list(iter_timeseries(xmlfilepath, namespace, parser))
+
+
+def parse_files(xmlfilepaths, namespace, workers=1, parser='auto', cache=None):
+    '''
+    Parse PI-XML files to TimeSerie objects.
+
+    With workers > 1 the files are parsed in a process pool. The series
+    are returned in file order, equal to a serial run, with their
+    input_position and export_mtime recorded. With a ParseCache, files with a valid entry
+    are not parsed and parsed files are added to the cache.
+    '''
+    parsed = {}
+    if cache is not None:
+        for xmlfilepath in xmlfilepaths:
+            series = cache.load(xmlfilepath, namespace)
+            if series is not None:
+                parsed[xmlfilepath] = series
+    to_parse = [i for i in xmlfilepaths if i not in parsed]
+
+    if workers > 1 and len(to_parse) > 1:
+        with ProcessPoolExecutor(min(workers, len(to_parse))) as executor:
+            results = executor.map(
+                parse_pixml, to_parse, it.repeat(namespace), it.repeat(parser))
+            for xmlfilepath, series in zip(to_parse, results):
+                parsed[xmlfilepath] = series
+                logger.debug(f'Successfully parsed {xmlfilepath.name}')
+    else:
+        for xmlfilepath in to_parse:
+            parsed[xmlfilepath] = parse_pixml(xmlfilepath, namespace, parser)
+            logger.debug(f'Successfully parsed {xmlfilepath.name}')
+
+    if cache is not None:
+        for xmlfilepath in to_parse:
+            cache.store(xmlfilepath, namespace, parsed[xmlfilepath])
+
+    timeseries = [i for xmlfilepath in xmlfilepaths for i in parsed[xmlfilepath]]
+
+    # duplicates are resolved by the age of their export, see iter_groups
+    for xmlfilepath in xmlfilepaths:
+        export_mtime = xmlfilepath.stat().st_mtime_ns
+        for timeserie in parsed[xmlfilepath]:
+            timeserie.export_mtime = export_mtime
+
     # record original timeserie input order
-    input_order = [f'{i.locationId}{i.parameterId}' for i in timeseries]
+    TimeSerie.record_input_order(timeseries)
+    return timeseries
+
+
+def iter_groups(timeseries, join_events=True, H_to_SL=False, keep='first'):
+    '''
+    Group TimeSerie objects by output file.
 
+    Yields the filename without extension and the series written to it.
+    Equidistant series are grouped by timedelta and sublocation when
+    join_events, waterlevels are added to every group with H_to_SL.
+    Other series are yielded one by one. Duplicates and empty series
+    are removed, keep is the duplicate of the oldest (first) or newest
+    (last) export, or the first or last in input order for equal ages.
+    '''
     # group functions
     gr_tdelta = lambda x: x.timedelta
+    gr_input = lambda x: x.input_position
+    gr_age = lambda x: x.export_mtime or 0
     gr_subloc = TimeSerie.grouper
 
     # group by timedelta
@@ -66,7 +413,7 @@ def convert_pixml2csv(
 
     for timedelta, timedelta_group in timedelta_groups.items():
         # remove duplicate and empty TimeSerie objects
-        timeserie_subloc = [i for i in set(timedelta_group) if i.has_events]
+        timeserie_subloc = [i for i in deduplicate(timedelta_group, keep, gr_age) if i.has_events]
         timeserie_subloc = sorted(timeserie_subloc, key=gr_subloc)
         logger.debug(f'Removed empty/duplicates and sorted remaining TimeSerie objects')
 
@@ -91,27 +438,158 @@ def convert_pixml2csv(
                 # get original group_key as waterlevels might be added
                 group_key = v[0].get_group_key()
 
-                # possibly add waterlevels to same csv
-                # make copies to keep the process symmetric
-                v.extend([cp.deepcopy(i) for i in H_timeseries])
-
-                # restore original sort order
-                v = sorted(v, key=lambda x: input_order.index(f'{x.locationId}{x.parameterId}'))
+                # possibly add waterlevels to same csv, restore original sort order
+                # joining does not modify the series, so waterlevels are shared by groups
+                v = sorted(v + H_timeseries, key=gr_input)
 
-                # join events on timeindex and update column names
-                joined_events = TimeSerie.join_events(v)
-                logger.debug(f'Joined events of {len(v)} TimeSerie objects')
-
-                # write to disk
-                csvfile = f'{group_key}_T{timedelta.seconds / 60:.0f}.csv'
-                events_to_csv(joined_events, output_folder / csvfile)
-                logger.info(f'Saved {csvfile}')
+                yield f'{group_key}_T{timedelta.seconds / 60:.0f}', v
 
         # nonequidistant - write to single files
         else:
             for v in it.chain(*list(timedelta_subloc_groups.values())):
+                yield f'{v.stationName}_{v.parameterId}', [v]
+
+
+def group_table(group, join_events=True):
+    '''EventTable of a group yielded by iter_groups'''
+    if join_events and group[0].is_equidistant:
+        # join events on timeindex and update column names
+        logger.debug(f'Joined events of {len(group)} TimeSerie objects')
+        return TimeSerie.join_events(group)
+    return group[0].to_table()
+
+
+def iter_tables(groups, join_events=True):
+    '''yield the filename and EventTable of each group yielded by iter_groups'''
+    for filename, group in groups:
+        with profiler.stage('join') as stage:
+            table = group_table(group, join_events)
+            stage.add(series=len(group), rows=len(table))
+        yield filename, table
+
+
+def write_serial(tables, write_events, output_folder, file_format):
+    '''write each table before the next is joined, returns the written files'''
+    written = []
+    for filename, table in tables:
+        outputfile = f'{filename}.{file_format}'
+        with profiler.stage('write') as stage:
+            write_events(table, output_folder / outputfile)
+            stage.add(files=1, rows=len(table))
+        logger.info(f'Saved {outputfile}')
+        written.append(output_folder / outputfile)
+    return written
+
+
+def write_pipelined(tables, write_events, output_folder, file_format, threads=WRITER_THREADS,
+                    maxsize=None):
+    '''
+    Write tables in writer threads while the next tables are joined.
+
+    At most maxsize joined tables wait to be written, PIPELINE_MAXSIZE by
+    default, joining halts on the oldest write when the pipeline is full.
+    A file is written by one thread at a time. The write stage of the
+    profile spans the pipeline, including the joins. Returns the written
+    files.
+    '''
+    maxsize = maxsize or PIPELINE_MAXSIZE
+    written = []
+
+    def finish(outputfile, future):
+        future.result()
+        logger.info(f'Saved {outputfile}')
+        written.append(output_folder / outputfile)
+
+    with profiler.stage('write') as stage, ThreadPoolExecutor(threads) as executor:
+        pending = collections.deque()
+        for filename, table in tables:
+            outputfile = f'{filename}.{file_format}'
+            while pending and (len(pending) >= maxsize
+                               or any(i == outputfile for i, _ in pending)):
+                finish(*pending.popleft())
+
+            pending.append(
+                (outputfile, executor.submit(write_events, table, output_folder / outputfile)))
+            stage.add(files=1, rows=len(table))
+
+        while pending:
+            finish(*pending.popleft())
+    return written
+
+
+def sort_exports(xmlfilepaths):
+    '''
+    PI-XML files in input order, by name
+
+    The order of a folder listing depends on the filesystem. The input
+    order sets the column order of joined files, so it does not follow
+    the modification times, duplicates are resolved by those instead.
+    '''
+    return sorted(xmlfilepaths, key=lambda x: x.name)
+
+
+def convert_pixml2csv(
+        basename, xmlfilepattern, output_folder=None, join_events=True, H_to_SL=False,
+        workers=1, file_format='csv', append=False, parser='auto', cache_folder=None,
+        cache_size=CACHE_MAXSIZE, keep='first', pipeline=False, writer_threads=WRITER_THREADS):
+    '''
+    Convert pixml to csv - this function can be called from within FEWS.
+
+    The basename is the directory where the exported xmlfile(s) are located.
+    The xmlfilepattern matches the exported PIXML-file(s) by FEWS.
+    The basename is used when the output_folder is not specified.
+    The join_events argument specifies whether equidistant series
+    should written to the same file.
+    The workers argument sets the number of processes to parse files with.
+    The file_format argument is one of WRITERS, csv by default.
+    The typed parquet and feather formats require pyarrow.
+    With append, existing csv output is updated with the exported period
+    instead of being rewritten, see append_csv.
+    The parser argument selects the PI-XML backend, one of PARSERS.
+    With a cache_folder, parsed files are kept in a ParseCache of at most
+    cache_size bytes, unchanged files are not parsed again.
+    The keep argument selects the duplicate series that is written, that
+    of the oldest (first) or newest (last) export, see iter_groups. Files
+    are read in name order, see sort_exports.
+    With pipeline, tables are written by writer_threads threads while the
+    next groups are joined, see write_pipelined. Otherwise each table is
+    written before the next group is joined.
+
+    The resulting csvfiles are stripped from duplicates and empty series.
+    Returns the written files.
+    '''
+    xmlfilepaths = [i for i in basename.iterdir() if fnmatch.fnmatch(i.name, xmlfilepattern)]
+    return convert_files(
+        xmlfilepaths, output_folder or basename, join_events, H_to_SL, workers, file_format,
+        append, parser, cache_folder, cache_size, keep, pipeline, writer_threads)
+
+
+def convert_files(
+        xmlfilepaths, output_folder, join_events=True, H_to_SL=False, workers=1,
+        file_format='csv', append=False, parser='auto', cache_folder=None,
+        cache_size=CACHE_MAXSIZE, keep='first', pipeline=False, writer_threads=WRITER_THREADS):
+    '''convert_pixml2csv of the PI-XML files in xmlfilepaths, returns the written files'''
+    xmlfilepaths = sort_exports(xmlfilepaths)
+    write_events = WRITERS[file_format]
+    if append and file_format == 'csv':
+        write_events = append_csv
+    elif append:
+        logger.warning(f'Append not supported for {file_format}, files are rewritten')
+
+    # stream xmlfiles and convert serie tags to TimeSerie
+    parser = resolve_parser(parser)
+    logger.debug(f'Parsing PI-XML with {parser}')
+    cache = None if cache_folder is None else ParseCache(cache_folder, cache_size)
+    with profiler.stage('parse') as stage:
+        timeseries = parse_files(xmlfilepaths, NAMESPACE, workers, parser, cache)
+        stage.add(files=len(xmlfilepaths), series=len(timeseries),
+                  events=sum(len(i.events) for i in timeseries))
+
+    with profiler.stage('group') as stage:
+        groups = list(iter_groups(timeseries, join_events, H_to_SL, keep))
+        stage.add(groups=len(groups))
 
-                # write to disk
-                csvfile = f'{v.stationName}_{v.parameterId}.csv'
-                events_to_csv(v.events, output_folder / csvfile)
-                logger.info(f'Saved {csvfile}')
+    tables = iter_tables(groups, join_events)
+    if pipeline:
+        return write_pipelined(tables, write_events, output_folder, file_format, writer_threads)
+    return write_serial(tables, write_events, output_folder, file_format)
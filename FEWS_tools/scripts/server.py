@@ -0,0 +1,152 @@
+"""
+Serve mode - run pixml2csv and flagging2discharge commands in a warm process
+
+FEWS starts a new process for every module adapter call. In serve mode the
+scripts, pandas and the DAMO_pomp rule indexes stay loaded. Commands are
+sent by main.py with --server and run one at a time in the working
+directory of the caller, their log records are returned to the caller.
+
+Jobs are pickled and run as the serving user, so client and server share
+a secret. It is taken from FEWS_TOOLS_AUTHKEY, or else from KEY_FILE,
+which serve mode creates readable by the owner only.
+"""
+
+import os
+import sys
+import stat
+import logging
+import secrets
+import traceback
+from pathlib import Path
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from FEWS_tools import logger
+
+
+# shared secret of client and server when FEWS_TOOLS_AUTHKEY is not set
+KEY_FILE = Path.home() / '.fews_tools_authkey'
+
+# commands run in serve mode, watch runs until interrupted and would block the server
+SERVED_COMMANDS = ('pixml2csv', 'flagging2discharge')
+
+
+def load_authkey(create: bool = False) -> bytes:
+    '''
+    shared secret of client and server
+
+    FEWS_TOOLS_AUTHKEY, or else the content of KEY_FILE. With create, a
+    missing KEY_FILE is written with a random key and owner only access.
+    A KEY_FILE that others can read or write is refused on POSIX systems.
+    '''
+    authkey = os.environ.get('FEWS_TOOLS_AUTHKEY')
+    if authkey:
+        return authkey.encode()
+
+    if create:
+        try:
+            fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'w') as fw:
+                fw.write(secrets.token_hex(32))
+            logger.info(f'Created serve mode key {KEY_FILE}')
+
+    try:
+        mode = KEY_FILE.stat().st_mode
+        authkey = KEY_FILE.read_bytes().strip()
+    except FileNotFoundError:
+        raise RuntimeError(f'No serve mode key, set FEWS_TOOLS_AUTHKEY or start serve mode '
+                           f'to create {KEY_FILE}') from None
+
+    if os.name == 'posix' and stat.S_IMODE(mode) & 0o077:
+        raise RuntimeError(f'{KEY_FILE} is accessible by others, restrict it to its owner')
+    if not authkey:
+        raise RuntimeError(f'{KEY_FILE} is empty')
+    return authkey
+
+
+class LogRecords(logging.Handler):
+    '''formatted log records of a command, returned to the caller'''
+    def __init__(self) -> None:
+        super().__init__()
+        self.setFormatter(logging.Formatter('%(name)s - %(levelname)s - %(message)s'))
+        self.lines = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+
+
+def parse_address(address: str) -> tuple:
+    '''host:port to (host, port), the host defaults to localhost'''
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def run_job(argv: list, cwd: str) -> dict:
+    '''run a command line in cwd, returns whether it succeeded and its log'''
+    from FEWS_tools.cli import build_parser, run
+
+    records = LogRecords()
+    logger.addHandler(records)
+    previous = os.getcwd()
+    ok = False
+    try:
+        args = build_parser().parse_args(argv)
+        if args.command in SERVED_COMMANDS:
+            os.chdir(cwd)
+            run(args)
+            ok = True
+        else:
+            logger.error(f'{args.command} is not run in serve mode, choose from {SERVED_COMMANDS}')
+    except SystemExit:
+        logger.error(f'Invalid arguments: {argv}')
+    except Exception:
+        logger.error(traceback.format_exc())
+    finally:
+        os.chdir(previous)
+        logger.removeHandler(records)
+    return {'ok': ok, 'log': records.lines}
+
+
+def serve(address: str) -> None:
+    '''accept commands at host:port until a stop is received'''
+    # load the scripts and pandas once
+    import FEWS_tools.scripts.pixml2csv
+    import FEWS_tools.scripts.flagging2discharge
+
+    with Listener(parse_address(address), authkey=load_authkey(create=True)) as listener:
+        logger.info(f'Serving on {address}')
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                logger.warning(f'Connection refused: {e}')
+                continue
+
+            with conn:
+                try:
+                    job = conn.recv()
+                except (EOFError, OSError):
+                    continue
+
+                if job.get('stop'):
+                    conn.send({'ok': True, 'log': [f'Stopped serving on {address}']})
+                    break
+
+                logger.debug(f'Running {job["argv"]} in {job["cwd"]}')
+                conn.send(run_job(job['argv'], job['cwd']))
+
+    logger.info(f'Stopped serving on {address}')
+
+
+def submit(address: str, argv: list, stop: bool = False) -> int:
+    '''send a command line to serve mode, returns the exit code'''
+    with Client(parse_address(address), authkey=load_authkey()) as conn:
+        conn.send({'argv': argv, 'cwd': os.getcwd(), 'stop': stop})
+        reply = conn.recv()
+
+    for line in reply['log']:
+        print(line, file=sys.stderr)
+    return 0 if reply['ok'] else 1
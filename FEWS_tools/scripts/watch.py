@@ -0,0 +1,314 @@
+"""
+Watch mode - convert new PI-XML exports and update their flagging as they land
+
+Instead of scanning the whole export folder on every call, the folders are
+watched. Processed files are kept in a manifest with their mtime and size,
+only new or changed files are processed. A joined file holds the series of
+several exports, so when an export changes all exports are converted, the
+unchanged ones from the parse cache. File events are taken from the
+optional watchdog package, which uses inotify on Linux, the folders are
+polled when it is not installed.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import fnmatch
+import traceback
+from pathlib import Path
+
+from FEWS_tools import logger
+from FEWS_tools.scripts.pixml2csv import NAMESPACE, convert_files, parse_pixml, resolve_parser
+
+
+# processed files of all watched folders, kept in the export folder
+MANIFEST_FILE = '.watch_manifest.json'
+
+# parse cache of the exports in the export folder, unless a cache_folder is given
+CACHE_FOLDER = '.watch_cache'
+
+# seconds between polls
+INTERVAL = 5.
+
+# seconds a file is left unchanged before it is processed, exports may still be written
+SETTLE = 2.
+
+
+class Manifest:
+    '''
+    mtime and size of processed files, by path relative to the folder of the manifest
+
+    Files that failed are marked, they are not processed until they change.
+    '''
+    def __init__(self, folder: Path) -> None:
+        self.folder = Path(folder)
+        self.filepath = self.folder / MANIFEST_FILE
+        try:
+            with open(self.filepath) as fr:
+                self.files = json.load(fr)
+        except (OSError, ValueError):
+            self.files = {}
+
+    def key(self, folder: Path, name: str) -> str:
+        if folder == self.folder:
+            return name
+        return os.path.relpath(folder / name, self.folder)
+
+    def changed(self, folder: Path, name: str, stat: os.stat_result) -> bool:
+        return self.files.get(self.key(folder, name), [])[:2] != [stat.st_mtime_ns, stat.st_size]
+
+    def failed(self, folder: Path, name: str) -> bool:
+        return len(self.files.get(self.key(folder, name), [])) > 2
+
+    def record(self, filepath: Path, stat: os.stat_result = None, failed: bool = False) -> None:
+        '''record the stat the file was read with, by default its current stat'''
+        stat = stat or filepath.stat()
+        self.files[self.key(filepath.parent, filepath.name)] = \
+            [stat.st_mtime_ns, stat.st_size, *(['failed'] if failed else [])]
+
+    def save(self) -> None:
+        tmpfile = self.filepath.with_suffix('.tmp')
+        with open(tmpfile, 'w') as fw:
+            json.dump(self.files, fw)
+        os.replace(tmpfile, self.filepath)
+
+
+def start_observer(folders: list[Path], events: queue.Queue):
+    '''put the paths of file events in folders on events, None without watchdog'''
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if not event.is_directory:
+                events.put(Path(os.fsdecode(getattr(event, 'dest_path', '') or event.src_path)))
+
+    observer = Observer()
+    for folder in set(folders):
+        observer.schedule(Handler(), str(folder))
+    observer.start()
+    return observer
+
+
+class Watcher:
+    '''
+    Convert PI-XML exports in basename matching xmlfilepattern to output_folder.
+
+    Converted csv files are appended to, see append_csv. With a damo_pomp,
+    files in flag_folder matching the flagging pattern are updated in place,
+    see update_files. Converted files that match the pattern are updated
+    right away. flag_folder defaults to the output_folder. The options are
+    passed to convert_files and update_files, parsed exports are cached in
+    CACHE_FOLDER unless a cache_folder is given. Hidden files, e.g. the
+    manifest, state and temporary files, are not processed.
+    '''
+    def __init__(self, basename: Path, xmlfilepattern: str, output_folder: Path = None,
+                 damo_pomp: Path = None, flag_folder: Path = None, file_format: str = 'csv',
+                 settle: float = SETTLE, convert_options: dict = None,
+                 update_options: dict = None) -> None:
+        self.basename = Path(basename).resolve()
+        self.xmlfilepattern = xmlfilepattern
+        self.export_pattern = re.compile(fnmatch.translate(xmlfilepattern))
+        self.output_folder = Path(output_folder or basename).resolve()
+        self.damo_pomp = damo_pomp
+        self.flag_folder = Path(flag_folder or self.output_folder).resolve()
+        self.file_format = file_format
+        self.settle = settle
+        self.convert_options = dict(convert_options or {})
+        self.update_options = update_options or {}
+        if self.convert_options.get('cache_folder') is None:
+            self.convert_options['cache_folder'] = self.basename / CACHE_FOLDER
+
+        self.manifest = Manifest(self.basename)
+        self.flag_pattern = None
+        if damo_pomp is not None:
+            from FEWS_tools.scripts.flagging2discharge import file_pattern
+
+            self.flag_pattern = file_pattern(file_format)
+
+        # paths reported by file events, or None to scan the folders
+        self.candidates = None
+        # changed files that are not processed yet, checked again on the next poll
+        self.unsettled = set()
+
+    def is_export(self, folder: Path, name: str) -> bool:
+        return folder == self.basename and not name.startswith('.') \
+            and self.export_pattern.match(name) is not None
+
+    def is_flagged(self, folder: Path, name: str) -> bool:
+        return self.flag_pattern is not None and folder == self.flag_folder \
+            and not name.startswith('.') and self.flag_pattern.match(name) is not None
+
+    def iter_candidates(self):
+        '''(folder, name) of the paths of file events, or of all files in the watched folders'''
+        if self.candidates is not None:
+            yield from ((i.parent, i.name) for i in self.candidates)
+            return
+
+        # scandir and plain names, a folder may hold tens of thousands of files
+        for folder in {self.basename, self.flag_folder}:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    yield folder, entry.name
+
+    def changed(self) -> tuple[dict[Path, os.stat_result], dict[Path, os.stat_result]]:
+        '''settled new or changed exports and files to flag with their stat, in name order'''
+        now = time.time()
+        exports, flagged = {}, {}
+        for folder, name in set(self.iter_candidates()) | self.unsettled:
+            if self.is_export(folder, name):
+                changed = exports
+            elif self.is_flagged(folder, name):
+                changed = flagged
+            else:
+                continue
+
+            try:
+                stat = os.stat(os.path.join(folder, name))
+            except OSError:
+                self.unsettled.discard((folder, name))
+                continue
+            if not self.manifest.changed(folder, name, stat):
+                continue
+            if now - stat.st_mtime < self.settle:
+                self.unsettled.add((folder, name))
+            else:
+                changed[folder, name] = stat
+
+        self.unsettled -= exports.keys() | flagged.keys()
+        # exports are converted together, not while one of them is still written
+        if any(self.is_export(*i) for i in self.unsettled):
+            self.unsettled |= exports.keys()
+            exports = {}
+        return ({i / j: exports[i, j] for i, j in sorted(exports)},
+                {i / j: flagged[i, j] for i, j in sorted(flagged)})
+
+    def all_exports(self, changed: dict[Path, os.stat_result]) -> list[Path]:
+        '''the changed exports and the other exports that did not fail, in name order'''
+        with os.scandir(self.basename) as entries:
+            names = [i.name for i in entries if self.is_export(self.basename, i.name)
+                     and not self.manifest.failed(self.basename, i.name)]
+        return sorted({*changed, *(self.basename / i for i in names)})
+
+    def convert(self, exports: list[Path]) -> tuple[list[Path], list[Path], list[Path]]:
+        '''
+        convert_files of exports, returns the written files, converted and failed exports
+
+        When the conversion fails, the exports that cannot be parsed fail
+        and the others are converted without them. A failure that is not
+        due to an export fails none, the exports are converted again on
+        the next poll.
+        '''
+        try:
+            written = convert_files(
+                exports, self.output_folder, file_format=self.file_format, append=True,
+                **self.convert_options)
+            return written, exports, []
+        except Exception:
+            error = traceback.format_exc()
+
+        parser = resolve_parser(self.convert_options.get('parser', 'auto'))
+        failed = []
+        for filepath in exports:
+            try:
+                parse_pixml(filepath, NAMESPACE, parser)
+            except Exception:
+                failed.append(filepath)
+
+        if not failed or len(failed) == len(exports):
+            logger.error(f'Conversion of {[i.name for i in exports]} failed:\n{error}')
+            return [], [], failed
+
+        logger.error(f'Conversion of {[i.name for i in failed]} failed, '
+                     f'converting the other exports:\n{error}')
+        written, converted, more_failed = self.convert([i for i in exports if i not in failed])
+        return written, converted, failed + more_failed
+
+    def poll(self) -> tuple[int, int]:
+        '''
+        process the changed files, returns the number of converted and flagged files
+
+        When exports changed, all exports are converted, as the series of a
+        joined file may come from several exports. Converted files that are
+        unchanged are not flagged again.
+
+        Exports that cannot be parsed and files of which the flag update
+        fails are logged and recorded, they are processed again when they
+        change. Other conversion failures are retried on the next poll.
+        '''
+        exports, flagged = self.changed()
+        flagged = list(flagged)
+
+        converted = []
+        if exports:
+            logger.info(f'Converting {len(exports)} new or changed export(s)')
+            written, converted, failed = self.convert(self.all_exports(exports))
+            converted = [i for i in converted if i in exports]
+            # the stat before conversion, an export rewritten meanwhile is converted again
+            for filepath in converted:
+                self.manifest.record(filepath, exports[filepath])
+            for filepath in failed:
+                self.manifest.record(filepath, exports.get(filepath), failed=True)
+            self.manifest.save()
+
+            # changed converted files go straight to the flag update
+            flagged = sorted(set(flagged) | {
+                i for i in written if self.is_flagged(i.parent, i.name)
+                and self.manifest.changed(i.parent, i.name, i.stat())})
+
+        if flagged:
+            from FEWS_tools.scripts.flagging2discharge import update_files
+
+            logger.info(f'Updating flagging of {len(flagged)} new or changed file(s)')
+            try:
+                update_files(flagged, self.damo_pomp, self.flag_folder, self.file_format,
+                             **self.update_options)
+            except Exception:
+                logger.error(f'Flag update of {[i.name for i in flagged]} failed:\n'
+                             f'{traceback.format_exc()}')
+            # updated in place, the written file is recorded
+            for filepath in flagged:
+                self.manifest.record(filepath)
+            self.manifest.save()
+
+        return len(converted), len(flagged)
+
+    def run(self, interval: float = INTERVAL, events: bool = True) -> None:
+        '''
+        poll until interrupted
+
+        With events and watchdog installed, polls after the first only
+        check the paths of file events, or else the folders are scanned.
+        '''
+        file_events = queue.Queue()
+        observer = start_observer([self.basename, self.flag_folder], file_events) \
+            if events else None
+        logger.info(f'Watching {self.basename} for {self.xmlfilepattern}, '
+                    f'{"file events" if observer is not None else "polling"} '
+                    f'every {interval} s')
+        try:
+            while True:
+                self.poll()
+                if observer is None:
+                    time.sleep(interval)
+                    continue
+
+                # collect file events until the interval passes
+                self.candidates = []
+                deadline = time.monotonic() + interval
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        self.candidates.append(file_events.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+        except KeyboardInterrupt:
+            logger.info(f'Stopped watching {self.basename}')
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
@@ -0,0 +1,3 @@
+'''
+Benchmarks for FEWS_tools - run a module with: python -m benchmarks.<module>
+'''
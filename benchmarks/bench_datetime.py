@@ -0,0 +1,41 @@
+"""
+Timestamp parsing of event date and time strings
+
+Compares parse_datetimes with strptime per event and with the ISO
+parser of numpy on the joined strings, which was done before.
+"""
+
+import timeit
+import datetime as dt
+
+import numpy as np
+
+from FEWS_tools.lib.models import parse_datetimes
+
+
+def event_strings(n_events, timestep=300):
+    datetime = np.datetime64('2015-01-01T00:00:00') + np.arange(n_events) * timestep
+    strings = np.datetime_as_string(datetime).tolist()
+    return [i[:10] for i in strings], [i[11:] for i in strings]
+
+
+def strptime(dates, times):
+    return [dt.datetime.strptime(f'{d} {t}', '%Y-%m-%d %H:%M:%S') for d, t in zip(dates, times)]
+
+
+def numpy_iso(dates, times):
+    return np.char.add(np.char.add(dates, 'T'), times).astype('datetime64[s]')
+
+
+def main(n_events=1_000_000, number=3):
+    dates, times = event_strings(n_events)
+    expected = numpy_iso(dates, times)
+    assert (parse_datetimes(dates, times) == expected).all()
+
+    for name, func in (('strptime', strptime), ('numpy', numpy_iso), ('fixed', parse_datetimes)):
+        seconds = timeit.timeit(lambda: func(dates, times), number=number) / number
+        print(f'{name:>8}: {seconds * 1000:8.1f} ms, {n_events / seconds / 1e6:6.2f} M events/s')
+
+
+if __name__ == '__main__':
+    main()
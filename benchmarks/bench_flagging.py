@@ -0,0 +1,80 @@
+"""
+Rule application of update_flagging on a multi-year 5-minute file
+
+Compares apply_rules with applying the DAMO_pomp periods one by one,
+which was done before.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from FEWS_tools.lib.rules import RuleIndex
+from FEWS_tools.scripts.flagging2discharge import FLAG_MAPPING, apply_rules, flag_colname
+
+
+SUBLOC = 'P1'
+DTRES = '5'
+PARAMS = ('BS', 'SH', 'TT', 'A', 'Q.B')
+
+
+def synthetic_frame(years, timestep=300):
+    n_rows = years * 365 * 86400 // timestep
+    rng = np.random.default_rng(0)
+
+    frame = {'date': pd.date_range('2015-01-01', periods=n_rows, freq=f'{timestep}s').normalize()}
+    for param in PARAMS:
+        frame[f'value_{SUBLOC}_{param}.{DTRES}'] = rng.normal(size=n_rows)
+        frame[flag_colname(SUBLOC, param, DTRES)] = rng.integers(0, 9, size=n_rows)
+    return pd.DataFrame(frame)
+
+
+def synthetic_rules(years, n_periods):
+    '''n_periods consecutive periods over the years, cycling through TYPEFORMULE'''
+    bounds = pd.date_range('2015-01-01', f'{2015 + years}-01-01', periods=n_periods + 1)
+    typeformule = list(FLAG_MAPPING['DAMO_pomp'])[:4]
+    return pd.DataFrame({
+        'CODE': 'SL000001',
+        'TYPEFORMULE': [typeformule[i % len(typeformule)] for i in range(n_periods)],
+        'OBJECTBEGI': bounds[:-1].strftime('%d-%m-%Y'),
+        'OBJECTEIND': bounds[1:].strftime('%d-%m-%Y'),
+        })
+
+
+def apply_rules_per_period(csv_in, flag_rules, subloc, dtres):
+    flag_discharge_col = flag_colname(subloc, 'Q.B', dtres)
+    for rule in flag_rules.itertuples():
+        params = FLAG_MAPPING['DAMO_pomp'][rule.TYPEFORMULE]
+        flag_underlying_cols = [flag_colname(subloc, param, dtres) for param in params]
+        flag_underlying_cols += [flag_discharge_col]
+
+        start_period = pd.to_datetime(rule.OBJECTBEGI, format='%d-%m-%Y')
+        end_period = pd.to_datetime(rule.OBJECTEIND, format='%d-%m-%Y')
+        indexer = (start_period <= csv_in.date) & (csv_in.date < end_period)
+        csv_in.loc[indexer, flag_discharge_col] = csv_in.loc[
+            indexer, flag_underlying_cols].max(axis=1)
+
+
+def main(years=5, n_periods=48):
+    csv_in = synthetic_frame(years)
+    flag_rules = synthetic_rules(years, n_periods)
+    print(f'{len(csv_in)} rows, {n_periods} periods')
+
+    rules = RuleIndex.from_frame(flag_rules, FLAG_MAPPING['DAMO_pomp'])['SL000001']
+
+    results = []
+    for name, func, args in (('per period', apply_rules_per_period, flag_rules),
+                             ('apply_rules', apply_rules, rules)):
+        frame = csv_in.copy()
+        start = time.perf_counter()
+        func(frame, args, SUBLOC, DTRES)
+        print(f'{name:>12}: {time.perf_counter() - start:8.3f} s')
+        results.append(frame)
+
+    pd.testing.assert_frame_equal(*results)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""
+Reading the output of convert_pixml2csv in update_flagging per file format
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from FEWS_tools.lib.models import EventTable
+from FEWS_tools.scripts.pixml2csv import WRITERS
+from FEWS_tools.scripts.flagging2discharge import read_table
+
+
+def synthetic_table(n_rows, n_series, timestep=300):
+    start = np.datetime64('2015-01-01T00:00:00')
+    datetime = start + np.arange(n_rows) * np.timedelta64(timestep, 's')
+
+    rng = np.random.default_rng(0)
+    value = np.round(rng.normal(size=(n_rows, n_series)), 3)
+    value[rng.random(value.shape) < 0.05] = np.nan
+    flag = rng.integers(0, 9, size=(n_rows, n_series), dtype=np.int8)
+
+    labels = [(f'value_P1_{i}.5', f'flag_P1_{i}.5') for i in range(n_series)]
+    return EventTable(datetime, value, flag, labels, ['NaN'] * n_series)
+
+
+def main(years=3, n_series=6):
+    table = synthetic_table(years * 365 * 288, n_series)
+    print(f'{len(table)} rows x {n_series} series')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for file_format, write_events in WRITERS.items():
+            filepath = Path(tmpdir) / f'bench.{file_format}'
+            start = time.perf_counter()
+            write_events(table, filepath)
+            write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            read_table(filepath, file_format)
+            read = time.perf_counter() - start
+
+            size = filepath.stat().st_size / 2**20
+            print(f'{file_format:>8}: write {write:6.2f} s, read {read:6.2f} s, {size:7.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""
+Header field access of TimeSerie objects
+
+Compares the parsed Header record with a lookup in the
+<header> element on every access, which was done before.
+"""
+
+import cProfile
+import pstats
+import tempfile
+import timeit
+import itertools as it
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from FEWS_tools.lib.utils import ns
+from FEWS_tools.scripts.pixml2csv import iter_timeseries
+from benchmarks.synthetic import NAMESPACE, write_pixml
+
+
+class ElementHeader:
+    '''header fields looked up in the element on every access'''
+    def __init__(self, element, namespace):
+        self.element = element
+        self.namespace = namespace
+
+    @property
+    def stationName(self):
+        return self.element.find(ns('stationName', self.namespace)).text
+
+    @property
+    def locationId(self):
+        return self.element.find(ns('locationId', self.namespace)).text
+
+    @property
+    def parameterId(self):
+        return self.element.find(ns('parameterId', self.namespace)).text
+
+    @property
+    def location(self):
+        return self.stationName.split('_')[-2]
+
+    @property
+    def sublocation(self):
+        return self.stationName.split('_')[-1]
+
+
+def workload(headers):
+    '''header access pattern of convert_pixml2csv - dedup, grouping and ordering'''
+    unique = {(x.locationId.lower(), x.parameterId.lower()): x for x in headers}
+    keyed = sorted(unique.values(), key=lambda x: f'{x.location}_{x.sublocation}'.lower())
+    groups = {k: list(v) for k, v in it.groupby(
+        keyed, key=lambda x: f'{x.location}_{x.sublocation}'.lower())}
+    for group in groups.values():
+        sorted(group, key=lambda x: f'{x.locationId}{x.parameterId}')
+
+
+def count_calls(func, *args):
+    profile = cProfile.Profile()
+    profile.runcall(func, *args)
+    stats = pstats.Stats(profile).stats
+    return sum(v[1] for k, v in stats.items() if k[2] == "<method 'find' of "
+               "'xml.etree.ElementTree.Element' objects>")
+
+
+def main(n_series=20000, number=5):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        xmlfilepath = write_pixml(Path(tmpdir) / 'bench.xml', n_series, n_events=2)
+
+        root = ET.parse(xmlfilepath).getroot()
+        elements = [ElementHeader(s.find(ns('header', NAMESPACE)), NAMESPACE)
+                    for s in root.iter(ns('series', NAMESPACE))]
+        records = [t.header for t in iter_timeseries(xmlfilepath, NAMESPACE)]
+
+    for name, headers in (('element', elements), ('record', records)):
+        seconds = timeit.timeit(lambda: workload(headers), number=number)
+        calls = count_calls(workload, headers)
+        print(f'{name:>8}: {seconds / number * 1000:8.1f} ms/run, {calls:>8} find calls')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Restoring input order in joined groups of convert_pixml2csv
+
+Compares sorting on a list.index lookup of the input key, which
+was done before, with the input_position recorded at parse time.
+"""
+
+import sys
+import tempfile
+import time
+import itertools as it
+from pathlib import Path
+
+from FEWS_tools.lib.models import TimeSerie
+from FEWS_tools.scripts.pixml2csv import parse_files
+from benchmarks.synthetic import NAMESPACE, write_pixml
+
+
+def sort_groups(groups, key):
+    return [sorted(group, key=key) for group in groups]
+
+
+def main(n_series=50000):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        xmlfilepath = write_pixml(Path(tmpdir) / 'bench.xml', n_series, n_events=2)
+        timeseries = parse_files([xmlfilepath], NAMESPACE)
+
+    grouped = sorted(timeseries, key=TimeSerie.grouper)
+    groups = [list(v) for _, v in it.groupby(grouped, key=TimeSerie.grouper)]
+    print(f'{len(timeseries)} series in {len(groups)} groups')
+
+    start = time.perf_counter()
+    TimeSerie.record_input_order(timeseries)
+    positions = sort_groups(groups, key=lambda x: x.input_position)
+    print(f'input_position: {time.perf_counter() - start:8.3f} s (incl. recording)')
+
+    start = time.perf_counter()
+    input_order = [f'{i.locationId}{i.parameterId}' for i in timeseries]
+    index = sort_groups(
+        groups, key=lambda x: input_order.index(f'{x.locationId}{x.parameterId}'))
+    print(f'    list.index: {time.perf_counter() - start:8.3f} s')
+
+    assert positions == index
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""
+Throughput of the pixml2csv and flagging2discharge pipelines
+
+Runs the parse, group, join, write and flag stages on a synthetic PI-XML
+export and DAMO_pomp file. Reports the time and events/s of every stage
+and the peak RSS, and compares them with a stored baseline.
+
+    python -m benchmarks.suite --series 500 --events 8640
+    python -m benchmarks.suite --series 500 --events 8640 --save-baseline
+
+The baseline is only compared when it was recorded with the same options.
+"""
+
+import sys
+import json
+import time
+import argparse
+import datetime as dt
+import tempfile
+from pathlib import Path
+
+from FEWS_tools import logger
+from FEWS_tools.scripts.pixml2csv import (
+    events_to_csv, group_table, iter_groups, parse_files, resolve_parser)
+from FEWS_tools.scripts.flagging2discharge import update_flagging
+from benchmarks.synthetic import NAMESPACE, PARAMETERS, write_damo_pomp, write_pixml
+
+
+BASELINE = Path(__file__).with_name('baseline.json')
+
+STAGES = ('parse', 'group', 'join', 'write', 'flag')
+
+# stages shorter than this are not reported as regression, their timing is noise
+MIN_SECONDS = 0.01
+
+
+def peak_rss_mb():
+    '''peak resident set size of this process, None where unavailable'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def write_inputs(folder, options):
+    '''synthetic export split over options.files and a DAMO_pomp covering its period'''
+    start = dt.datetime(2020, 1, 1)
+    per_file = -(-options.series // options.files)
+    xmlfilepaths = []
+    for i, first in enumerate(range(0, options.series, per_file)):
+        xmlfilepaths.append(write_pixml(
+            folder / f'export_{i}.xml', min(per_file, options.series - first), options.events,
+            options.timestep, start, first))
+
+    end = start + dt.timedelta(seconds=options.timestep * options.events) + dt.timedelta(days=1)
+    n_structures = -(-options.series // len(PARAMETERS))
+    damo_pomp = write_damo_pomp(
+        folder / 'DAMO_pomp.csv', n_structures, start.date(), end.date(), options.period_days)
+    return xmlfilepaths, damo_pomp
+
+
+def run(options):
+    '''time the pipeline stages, returns the seconds by stage'''
+    seconds = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        xmlfilepaths, damo_pomp = write_inputs(tmpdir, options)
+        output_folder = tmpdir / 'output'
+        output_folder.mkdir()
+
+        start = time.perf_counter()
+        timeseries = parse_files(xmlfilepaths, NAMESPACE, options.workers, options.parser)
+        seconds['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        groups = list(iter_groups(timeseries))
+        seconds['group'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tables = [(filename, group[0], group_table(group)) for filename, group in groups]
+        seconds['join'] = time.perf_counter() - start
+
+        # the structure code is added to the filename as done in FEWS for flagging
+        start = time.perf_counter()
+        for filename, serie, table in tables:
+            events_to_csv(table, output_folder / f'{filename}_{serie.locationId}.csv')
+        seconds['write'] = time.perf_counter() - start
+        del timeseries, groups, tables
+
+        start = time.perf_counter()
+        update_flagging(output_folder, damo_pomp, workers=options.workers, cache_rules=False)
+        seconds['flag'] = time.perf_counter() - start
+    return seconds
+
+
+def compare(result, baseline, tolerance):
+    '''print the result next to the baseline, returns the stages that regressed'''
+    n_events = result['events']
+    regressed = []
+    print(f'{"stage":>8} {"seconds":>10} {"M events/s":>11} {"baseline":>10} {"ratio":>7}')
+    for stage in STAGES:
+        seconds = result['seconds'][stage]
+        line = f'{stage:>8} {seconds:10.3f} {n_events / seconds / 1e6:11.2f}'
+        if baseline is not None:
+            ratio = seconds / baseline['seconds'][stage]
+            line += f' {baseline["seconds"][stage]:10.3f} {ratio:7.2f}'
+            if ratio > 1 + tolerance and seconds > MIN_SECONDS:
+                regressed.append(stage)
+                line += '  slower'
+        print(line)
+
+    total = sum(result['seconds'].values())
+    print(f'{"total":>8} {total:10.3f} {n_events / total / 1e6:11.2f}')
+    if result['peak_rss_mb'] is not None:
+        print(f'peak RSS {result["peak_rss_mb"]:.0f} MB')
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser('python -m benchmarks.suite', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=250)
+    parser.add_argument('--events', type=int, default=2016, help='events per series')
+    parser.add_argument('--timestep', type=int, default=300, help='seconds')
+    parser.add_argument('--period-days', type=int, default=7, help='DAMO_pomp period length')
+    parser.add_argument('--files', type=int, default=1, help='PI-XML files to split series over')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--parser', default='auto')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown reported as regression')
+    options = parser.parse_args(argv)
+    options.parser = resolve_parser(options.parser)
+
+    config = {k: v for k, v in vars(options).items()
+              if k not in ('baseline', 'save_baseline', 'tolerance')}
+    logger.setLevel('WARNING')
+    result = {'config': config, 'events': options.series * options.events,
+              'seconds': run(options), 'peak_rss_mb': peak_rss_mb()}
+
+    baseline = None
+    if options.baseline.exists() and not options.save_baseline:
+        baseline = json.loads(options.baseline.read_text())
+        if baseline['config'] != config:
+            print(f'{options.baseline} was recorded with other options, not compared')
+            baseline = None
+
+    regressed = compare(result, baseline, options.tolerance)
+    if options.save_baseline:
+        options.baseline.write_text(json.dumps(result, indent=1))
+        print(f'Saved baseline to {options.baseline}')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Generate synthetic PI-XML exports and DAMO_pomp files for benchmarking
+"""
+
+import datetime as dt
+from pathlib import Path
+
+
+NAMESPACE = "http://www.wldelft.nl/fews/PI"
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<TimeSeries xmlns="{namespace}" version="1.2">
+    <timeZone>0.0</timeZone>
+'''
+
+SERIES = '''    <series>
+        <header>
+            <type>instantaneous</type>
+            <locationId>{locationId}</locationId>
+            <parameterId>{parameterId}</parameterId>
+            <timeStep unit="second" multiplier="{timestep}"/>
+            <startDate date="{start:%Y-%m-%d}" time="{start:%H:%M:%S}"/>
+            <endDate date="{end:%Y-%m-%d}" time="{end:%H:%M:%S}"/>
+            <missVal>NaN</missVal>
+            <stationName>{stationName}</stationName>
+            <units>-</units>
+        </header>
+'''
+
+EVENT = '''        <event date="{0:%Y-%m-%d}" time="{0:%H:%M:%S}" value="{1}" flag="{2}"/>
+'''
+
+PARAMETERS = ('BS', 'SH', 'TT', 'A', 'Q.B')
+
+
+def iter_series(n_series, timestep=300, first=0):
+    '''yield (locationId, parameterId, stationName) of n_series pump series'''
+    for i in range(first, first + n_series):
+        structure, param = divmod(i, len(PARAMETERS))
+        yield (f'SL{structure:06d}',
+               f'{PARAMETERS[param]}.{timestep // 60}',
+               f'Structure {structure}_P1')
+
+
+def write_pixml(filepath: Path, n_series: int, n_events: int, timestep: int = 300,
+                start: dt.datetime = dt.datetime(2020, 1, 1), first: int = 0) -> Path:
+    '''
+    Write a PI-XML export with n_series equidistant series of n_events each,
+    first is the index of the first series, see iter_series
+    '''
+    step = dt.timedelta(seconds=timestep)
+    end = start + (n_events - 1) * step
+    timestamps = [start + i * step for i in range(n_events)]
+
+    with open(filepath, 'w') as fw:
+        fw.write(HEADER.format(namespace=NAMESPACE))
+        for s, (locationId, parameterId, stationName) in enumerate(
+                iter_series(n_series, timestep, first)):
+            fw.write(SERIES.format(
+                locationId=locationId, parameterId=parameterId, timestep=timestep,
+                start=start, end=end, stationName=stationName))
+            fw.writelines(
+                EVENT.format(t, f'{(s + i) % 1000 / 10}', (s + i) % 9)
+                for i, t in enumerate(timestamps))
+            fw.write('    </series>\n')
+        fw.write('</TimeSeries>\n')
+    return filepath
+
+
+DAMO_POMP_COLUMNS = (
+    'Versie1_ALB', 'GlobalpompID', 'OBJECTID', 'CODE', 'NAAM', 'TYPEPOMP', 'TYPEFORMULE',
+    'POMPCAP', 'MAX_AMPERE', 'MAX_TOER', 'MIN_TOER', 'OBJECTBEGI', 'OBJECTEIND', 'GECONTROLEERD')
+
+TYPEFORMULE = ('Bedrijfsstatus', 'Snelheid', 'Toerental', 'Ampere')
+
+
+def write_damo_pomp(filepath: Path, n_structures: int, start: dt.date, end: dt.date,
+                    period_days: int = 30) -> Path:
+    '''
+    Write a DAMO_pomp file with consecutive periods of period_days between
+    start and end for the structures of iter_series, cycling through TYPEFORMULE
+    '''
+    bounds = [start + dt.timedelta(days=i) for i in range(0, (end - start).days, period_days)]
+    bounds.append(end)
+
+    with open(filepath, 'w') as fw:
+        fw.write(';'.join(DAMO_POMP_COLUMNS) + '\n')
+        for structure in range(n_structures):
+            for i, (begin, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+                fw.write(';'.join([
+                    '1', '', f'KGM_{structure:06d}', f'SL{structure:06d}',
+                    f'Structure {structure}_P1', 'Pompvijzel', TYPEFORMULE[i % len(TYPEFORMULE)],
+                    '40', '37.5', '39', '0', f'{begin:%d-%m-%Y}', f'{stop:%d-%m-%Y}', '2']) + '\n')
+    return filepath
@@ -7,11 +7,13 @@ TESTPATH = BASEPATH / 'tests'
 DATAPATH = TESTPATH / 'data'
 CONVDATA = DATAPATH / 'convert'
 FLAGDATA = DATAPATH / 'flagging'
+GOLDDATA = DATAPATH / 'golden'
 OUTPUTPATH = DATAPATH / 'output'
 
 PIXML_TIMESERIES_SL = 'pixml_timeseries_sl.xml'
 PIXML_TIMESERIES_HL = 'pixml_timeseries_hl.xml'
 PIXML_TIMESERIES_HL_SL = 'pixml_timeseries_hl_sl.xml'
 PIXML_TIMESERIES_HL_ORDER = 'pixml_timeseries_hl_order.xml'
+PIXML_TIMESERIES_VALUES = 'pixml_timeseries_values.xml'
 
 DAMO_POMP = FLAGDATA / 'DAMO_pomp.csv'
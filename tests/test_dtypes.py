@@ -1,6 +1,6 @@
 import unittest
 
-from FEWS_tools.lib.dtypes import GroupSet
+from FEWS_tools.lib.dtypes import GroupSet, deduplicate
 
 
 class TestGroupSet(unittest.TestCase):
@@ -35,6 +35,51 @@ class TestGroupSet(unittest.TestCase):
     def test_groupset_single_sort_key(self):
         pass
 
+    def test_groupset_order(self):
+        groupsets = [GroupSet('A', 'SL2', 'Q'), GroupSet('a', 'sl1', 'Q'), GroupSet('B', 'SL1', 'H')]
+        self.assertListEqual([i.key for i in sorted(groupsets)],
+                             [('sl1', 'h'), ('sl1', 'q'), ('sl2', 'q')])
+        self.assertEqual(GroupSet.grouper(groupsets[0]), 'a')
+
+        with self.assertRaises(AttributeError):
+            groupsets[0].other = 'slotted'
+
+    def test_groupset_compare_other_types(self):
+        groupset = GroupSet('Amsterdam')
+        self.assertFalse(groupset == None)
+        self.assertTrue(groupset != 'amsterdam')
+        self.assertNotIn(groupset, [None, 'amsterdam'])
+        with self.assertRaises(TypeError):
+            groupset < None
+
+    def test_deduplicate(self):
+        first, second, last = GroupSet('A', 'SL1'), GroupSet('B', 'SL2'), GroupSet('a', 'sl1')
+
+        kept = deduplicate([first, second, last])
+        self.assertListEqual(kept, [first, second])
+        self.assertIs(kept[0], first)
+
+        kept = deduplicate([first, second, last], keep='last')
+        self.assertListEqual(kept, [last, second])
+        self.assertIs(kept[0], last)
+
+        with self.assertRaises(ValueError):
+            deduplicate([first], keep='newest')
+
+    def test_deduplicate_by_age(self):
+        first, second, last = GroupSet('A', 'SL1'), GroupSet('B', 'SL2'), GroupSet('a', 'sl1')
+        ages = {id(first): 2, id(second): 0, id(last): 1}
+        age = lambda x: ages[id(x)]
+
+        # in order of first occurrence, the oldest or newest is kept
+        self.assertIs(deduplicate([first, second, last], age=age)[0], last)
+        self.assertIs(deduplicate([first, second, last], 'last', age)[0], first)
+
+        # equal ages by position
+        age = lambda x: 0
+        self.assertIs(deduplicate([first, second, last], age=age)[0], first)
+        self.assertIs(deduplicate([first, second, last], 'last', age)[0], last)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,10 +1,17 @@
+import json
+import shutil
 import unittest
 import tempfile
+import importlib.util
 from pathlib import Path
+from unittest.mock import patch
 
+import numpy as np
 import pandas as pd
 
-from FEWS_tools.scripts.flagging2discharge import update_flagging
+from FEWS_tools.lib.utils import file_hash
+from FEWS_tools.scripts.flagging2discharge import (
+    STATE_FILE, file_pattern, period_mask, update_flagging)
 from tests import DEBUG, FLAGDATA, DAMO_POMP, OUTPUTPATH
 
 
@@ -42,6 +49,172 @@ class TestUpdateFlagging(unittest.TestCase):
         expected_flags = [2,2,2,2,5,5,5,5,8,8]
         self.assertListEqual(updated_discharge_flags, expected_flags)
 
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'requires pyarrow')
+    def test_convert_flagging_parquet_t1(self):
+        input_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        for file in (FLAGDATA / 't1').iterdir():
+            df = pd.read_csv(file, parse_dates=['date'])
+            df.to_parquet(input_folder / f'{file.stem}.parquet', index=False)
+
+        update_flagging(input_folder, DAMO_POMP, file_format='parquet')
+        result_df = pd.read_parquet(
+            input_folder / 'Bleskensgraaf Noordzijde_P1_T5_SL000253.parquet')
+        updated_discharge_flags = result_df['flag_P1_Q.B.5'].tolist()
+
+        expected_flags = [8,8,2,2,5,5,3,3,3,3]
+        self.assertListEqual(updated_discharge_flags, expected_flags)
+
+        for file in input_folder.iterdir():
+            file.unlink()
+        input_folder.rmdir()
+
+    def test_convert_flagging_workers_equals_serial(self):
+        serial_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        input_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        for file in [*(FLAGDATA / 't1').iterdir(), *(FLAGDATA / 't2').iterdir()]:
+            shutil.copy(file, input_folder)
+
+        update_flagging(input_folder, DAMO_POMP, serial_folder)
+        update_flagging(input_folder, DAMO_POMP, self.tmp_output_folder, workers=2)
+
+        serial_files = sorted(serial_folder.iterdir())
+        self.assertEqual(len(serial_files), 2)
+        for file in serial_files:
+            self.assertEqual(file.read_bytes(), (self.tmp_output_folder / file.name).read_bytes())
+
+        shutil.rmtree(serial_folder)
+        shutil.rmtree(input_folder)
+
+    def test_convert_flagging_chunked_equals_full(self):
+        full_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        for t in ('t1', 't2'):
+            update_flagging(FLAGDATA / t, DAMO_POMP, full_folder)
+            update_flagging(FLAGDATA / t, DAMO_POMP, self.tmp_output_folder, chunksize=3)
+
+        full_files = sorted(full_folder.iterdir())
+        self.assertEqual(len(full_files), 2)
+        for file in full_files:
+            self.assertEqual(file.read_bytes(), (self.tmp_output_folder / file.name).read_bytes())
+        shutil.rmtree(full_folder)
+
+    def test_convert_flagging_incremental_t1(self):
+        full_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        input_folder = Path(tempfile.mkdtemp(dir=self.tmp_output_folder))
+        update_flagging(FLAGDATA / 't1', DAMO_POMP, full_folder)
+
+        # first run on the first rows, second run on the appended rows
+        # the appended rows of the first split turn an int column into floats
+        name = 'Bleskensgraaf Noordzijde_P1_T5_SL000253.csv'
+        lines = {i.name: i.read_bytes().splitlines(keepends=True)
+                 for i in (FLAGDATA / 't1').iterdir()}
+        for split in (6, 8):
+            (self.tmp_output_folder / STATE_FILE).unlink(missing_ok=True)
+            for file_name, file_lines in lines.items():
+                (input_folder / file_name).write_bytes(b''.join(file_lines[:split]))
+            update_flagging(input_folder, DAMO_POMP, self.tmp_output_folder, incremental=True)
+            flagged = (self.tmp_output_folder / name).read_bytes()
+
+            for file_name, file_lines in lines.items():
+                with open(input_folder / file_name, 'ab') as fw:
+                    fw.write(b''.join(file_lines[split:]))
+            update_flagging(input_folder, DAMO_POMP, self.tmp_output_folder, incremental=True)
+
+            state = json.loads((self.tmp_output_folder / STATE_FILE).read_text())
+            self.assertEqual(state[name]['last'], '2010-01-05 15:15:00')
+            self.assertEqual(
+                (self.tmp_output_folder / name).read_bytes().startswith(flagged), split == 8)
+            for file in full_folder.iterdir():
+                self.assertEqual((self.tmp_output_folder / file.name).read_bytes(),
+                                 file.read_bytes(), file.name)
+
+        # a changed row before the last processed timestamp triggers a full update
+        file_lines = lines[name]
+        file_lines[1] = file_lines[1].replace(b',8', b',9', 1)
+        (input_folder / name).write_bytes(b''.join(file_lines))
+        update_flagging(input_folder, DAMO_POMP, full_folder)
+        update_flagging(input_folder, DAMO_POMP, self.tmp_output_folder, incremental=True)
+        self.assertEqual(
+            (self.tmp_output_folder / name).read_bytes(), (full_folder / name).read_bytes())
+
+        shutil.rmtree(full_folder)
+        shutil.rmtree(input_folder)
+
+    def test_convert_flagging_incremental_inplace_t1(self):
+        name = 'Bleskensgraaf Noordzijde_P1_T5_SL000253.csv'
+        lines = (FLAGDATA / 't1' / name).read_bytes().splitlines(keepends=True)
+        file = self.tmp_output_folder / name
+        file.write_bytes(b''.join(lines[:8]))
+        update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+        flagged = file.read_bytes()
+
+        # flagged rows are kept, the appended rows are flagged in place
+        file.write_bytes(flagged + b''.join(lines[8:]))
+        update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+        self.assertTrue(file.read_bytes().startswith(flagged))
+        self.assertTrue(file.read_bytes().endswith(b'15:15:00,NaN,9,NaN,8,0.0,3,NaN,8,0.0,3\n'))
+
+        updated_discharge_flags = pd.read_csv(file)['flag_P1_Q.B.5'].tolist()
+        self.assertListEqual(updated_discharge_flags, [8,8,2,2,5,5,3,3,3,3])
+
+    def test_incremental_state_reads_tail(self):
+        name = 'Bleskensgraaf Noordzijde_P1_T5_SL000253.csv'
+        lines = (FLAGDATA / 't1' / name).read_bytes().splitlines(keepends=True)
+        file = self.tmp_output_folder / name
+        file.write_bytes(b''.join(lines[:8]))
+        update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+        flagged = file.read_bytes()
+
+        # only the last bytes of the processed rows are hashed
+        file.write_bytes(flagged + b''.join(lines[8:]))
+        with patch('FEWS_tools.scripts.flagging2discharge.STATE_TAIL', 64), \
+                patch('FEWS_tools.scripts.flagging2discharge.file_hash',
+                      wraps=file_hash) as hashed:
+            update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+            self.assertTrue(file.read_bytes().startswith(flagged))
+            for (filepath, *size_start), _ in hashed.call_args_list:
+                if filepath == file:
+                    self.assertEqual(size_start[0] - size_start[1], 64)
+
+            # an unchanged file is not read
+            hashed.reset_mock()
+            with patch('FEWS_tools.scripts.flagging2discharge.append_rows',
+                       return_value=([], None)) as append_rows:
+                update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+            append_rows.assert_called_once()
+            # hashed for the new state only
+            self.assertEqual([i.args[0] for i in hashed.call_args_list].count(file), 1)
+
+            # a changed row in the hashed bytes triggers a full update
+            file.write_bytes(file.read_bytes()[:-2] + b'4\n')
+            with patch('FEWS_tools.scripts.flagging2discharge.append_rows') as append_rows:
+                update_flagging(self.tmp_output_folder, DAMO_POMP, incremental=True)
+            append_rows.assert_not_called()
+
+
+class TestFilePattern(unittest.TestCase):
+    def test_temporary_files_do_not_match(self):
+        name = 'Bleskensgraaf Noordzijde_P1_T5_SL000253.csv'
+        pattern = file_pattern('csv')
+
+        self.assertEqual(pattern.match(name).groups(), ('P1', 'T5', 'SL000253'))
+        self.assertIsNone(pattern.match(f'.{name}.tmp'))
+        self.assertIsNone(file_pattern('parquet').match(name))
+
+
+class TestPeriodMask(unittest.TestCase):
+    def test_period_mask(self):
+        dates = np.arange('2010-01-01', '2010-01-11', dtype='datetime64[D]')
+        begins = np.array(['2010-01-02', '2010-01-03', '2010-01-08', '2010-01-10'], dtype='datetime64[D]')
+        ends = np.array(['2010-01-04', '2010-01-05', '2010-01-09', '2010-01-09'], dtype='datetime64[D]')
+
+        # overlapping periods are merged, end is exclusive and empty periods are ignored
+        expected = (dates >= begins[0]) & (dates < ends[1]) | (dates == begins[2])
+        np.testing.assert_array_equal(period_mask(dates, begins, ends), expected)
+
+        # unsorted dates
+        order = np.random.default_rng(0).permutation(len(dates))
+        np.testing.assert_array_equal(period_mask(dates[order], begins, ends), expected[order])
+
 
 if __name__ == '__main__':
     unittest.main()
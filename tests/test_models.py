@@ -1,10 +1,15 @@
 import unittest
 import datetime as dt
 import itertools as it
+import importlib.util
 import xml.etree.ElementTree as ET
 
+import numpy as np
+
 from FEWS_tools.lib.utils import ns
-from FEWS_tools.lib.models import TimeSerie
+from FEWS_tools.lib.models import (
+    MISSING_FLAG, NO_FLAG, Events, EventTable, Header, TimeSerie, format_values,
+    parse_datetimes)
 from tests import (
     CONVDATA, PIXML_TIMESERIES_SL, PIXML_TIMESERIES_HL, PIXML_TIMESERIES_HL_SL)
 
@@ -44,14 +49,29 @@ class TestTimeSerieInstances(unittest.TestCase):
         self.assertEqual(timeserie1.timedelta, dt.timedelta(seconds=300))
         self.assertTrue(timeserie1.is_equidistant)
 
+    def test_header_unknown_timestep(self):
+        msg = 'month is not implemented as a valid timestep.'
+        with self.assertRaises(TypeError) as e:
+            Header.parse_timestep({'unit': 'month', 'multiplier': '1'})
+        self.assertEqual(str(e.exception), msg)
+
     def test_timeserie_duplicate(self):
         timeserie1 = TimeSerie(self.serie1, self.namespace)
         timeserie1_duplicate = TimeSerie(self.serie1_duplicate, self.namespace)
         self.assertEqual(timeserie1, timeserie1_duplicate)
     
+    def test_record_input_order(self):
+        timeseries = [TimeSerie(i, self.namespace) for i in
+                      (self.serie1, self.serie2, self.serie3, self.serie1_duplicate)]
+        TimeSerie.record_input_order(timeseries)
+
+        # duplicates share the position of the first occurrence
+        positions = [i.input_position for i in timeseries]
+        self.assertListEqual(positions, [0, 1, 2, 0])
+
     def test_timeserie_nodata_events(self):
         timeserie5 = TimeSerie(self.serie5_nodata_events, self.namespace)
-        self.assertEqual(timeserie5.events, [])
+        self.assertEqual(len(timeserie5.events), 0)
 
     def test_timeserie_no_events(self):
         timeserie4_no_events = TimeSerie(self.serie4_no_events, self.namespace)
@@ -65,31 +85,90 @@ class TestTimeSerieInstances(unittest.TestCase):
         timeserie2 = TimeSerie(self.serie2, self.namespace)
         self.assertFalse(timeserie2.has_continuous_timeindex())
 
-    def test_update_events(self):
+    def test_column_labels(self):
         timeserie1 = TimeSerie(self.serie1, self.namespace)
-        timeserie1.update_events()
         suffix = f'{timeserie1.sublocation}_{timeserie1.parameterId}'
+        self.assertTupleEqual(timeserie1.column_labels, (f'value_{suffix}', f'flag_{suffix}'))
+
+        columns = TimeSerie.join_events(timeserie1).columns
+        self.assertListEqual(columns, ['date', 'time', f'value_{suffix}', f'flag_{suffix}'])
 
-        value_key = f'value_{suffix}'
-        self.assertTrue(all(value_key in event for event in timeserie1.events))
+        # joining leaves the series untouched
+        self.assertListEqual(timeserie1.to_table().columns, ['date', 'time', 'value', 'flag'])
+        with self.assertRaises(ValueError):
+            timeserie1.events.value[0] = 0
 
-        flag_key = f'flag_{suffix}'
-        self.assertTrue(all(flag_key in event for event in timeserie1.events))
+    def test_events_columnar(self):
+        timeserie2 = TimeSerie(self.serie2, self.namespace)
+        events = timeserie2.events
+
+        self.assertEqual(events.datetime.dtype, np.dtype('datetime64[s]'))
+        self.assertEqual(events.value.dtype, np.dtype(float))
+        self.assertEqual(events.flag.dtype, np.dtype(np.int8))
+
+        # missing values are NaN and written as missVal
+        self.assertTrue(np.isnan(events.value[2]))
+        block = timeserie2.to_table().to_block()
+        self.assertListEqual(block[2].tolist(), ['2018-04-12', '09:25:00', 'NaN', '2'])
+        self.assertListEqual(block[0].tolist(), ['2018-04-12', '09:15:00', '-1.606', '2'])
     
     def test_join_events(self):
         timeserie1 = TimeSerie(self.serie1, self.namespace)
         timeserie2 = TimeSerie(self.serie2, self.namespace)
         timeserie3 = TimeSerie(self.serie3, self.namespace)
 
-        event_chainmaps = TimeSerie.join_events([timeserie1, timeserie2, timeserie3])
-        self.assertEqual(len(event_chainmaps), 8)
+        joined_table = TimeSerie.join_events([timeserie1, timeserie2, timeserie3])
+        self.assertEqual(len(joined_table), 8)
+        self.assertEqual(len(joined_table.columns), 8)
+
+        expected_values = [
+            '2018-04-12', '09:15:00', '-1.455', '2', '-1.606', '2', '-1.4', '4']
+        self.assertListEqual(joined_table.to_block()[0].tolist(), expected_values)
+
+    def test_join_events_outer_join(self):
+        # serie2 starts one timestep later, serie3 has a gap
+        self.serie2.remove(self.serie2.find(ns('event', self.namespace)))
+        self.serie3.remove(self.serie3.findall(ns('event', self.namespace))[3])
+        timeserie1 = TimeSerie(self.serie1, self.namespace)
+        timeserie2 = TimeSerie(self.serie2, self.namespace)
+        timeserie3 = TimeSerie(self.serie3, self.namespace)
+
+        joined_table = TimeSerie.join_events([timeserie1, timeserie2, timeserie3])
+        self.assertEqual(len(joined_table), 8)
+
+        block = joined_table.to_block()
+        self.assertListEqual(block[0, 4:6].tolist(), ['NaN', str(MISSING_FLAG)])
+        self.assertListEqual(block[3, 6:8].tolist(), ['NaN', str(MISSING_FLAG)])
+        self.assertListEqual(block[1, 4:6].tolist(), ['-1.606', '2'])
+
+    def test_join_events_shared_gap(self):
+        # a timestep absent in all series is padded, the index stays equidistant
+        for serie in (self.serie1, self.serie2):
+            serie.remove(serie.findall(ns('event', self.namespace))[3])
+        timeserie1 = TimeSerie(self.serie1, self.namespace)
+        timeserie2 = TimeSerie(self.serie2, self.namespace)
+
+        for timeseries in ([timeserie1], [timeserie1, timeserie2]):
+            joined_table = TimeSerie.join_events(timeseries)
+            self.assertEqual(len(joined_table), 8)
+            self.assertTrue(np.all(np.diff(joined_table.datetime) == np.timedelta64(5, 'm')))
+            self.assertListEqual(joined_table.to_block()[3, 2:4].tolist(),
+                                 ['NaN', str(MISSING_FLAG)])
+
+    def test_reorder_table(self):
+        timeserie1 = TimeSerie(self.serie1, self.namespace)
+        timeserie2 = TimeSerie(self.serie2, self.namespace)
+        table = TimeSerie.join_events([timeserie1, timeserie2])
+
+        columns = [*table.columns[:2], *table.columns[4:], *table.columns[2:4]]
+        reordered = table.reorder(columns)
+        self.assertListEqual(reordered.columns, columns)
+        self.assertListEqual(reordered.to_block()[0].tolist(),
+                             ['2018-04-12', '09:15:00', '-1.606', '2', '-1.455', '2'])
 
-        chainmap_t0 = event_chainmaps[0]
-        self.assertEqual(len(chainmap_t0), 8)
-        
-        expected_values = (
-            '2018-04-12', '09:15:00', '-1.455', '2', '-1.606', '2', '-1.4', '4')
-        self.assertTupleEqual(tuple(chainmap_t0.values()), expected_values)
+        # a value and flag of different series, or other columns
+        self.assertIsNone(table.reorder([*columns[:3], *columns[5:], *columns[3:5]]))
+        self.assertIsNone(table.reorder(columns[:4]))
 
     def test_join_events_nonequidistant(self):
         msg = 'Nonequidistant events cannot be joined.'
@@ -202,6 +281,85 @@ class TestTimeSeriesTimeGroupby(unittest.TestCase):
         # all elements should have been popped
         self.assertEqual(loc_groups, {})
 
+class TestParseDatetimes(unittest.TestCase):
+    def test_parse_datetimes_equals_iso(self):
+        seconds = np.random.default_rng(0).integers(-2 * 10**9, 4 * 10**9, 1000)
+        expected = seconds.astype('datetime64[s]')
+        strings = np.datetime_as_string(expected).tolist()
+
+        result = parse_datetimes([i[:10] for i in strings], [i[11:] for i in strings])
+        np.testing.assert_array_equal(result, expected)
+
+    def test_parse_datetimes_fallback(self):
+        result = parse_datetimes(['2018-04-12', '2018-04-12'], ['09:15:00', '09:20'])
+        self.assertEqual(result[1], np.datetime64('2018-04-12T09:20:00'))
+
+        for date, time in (('2019-02-29', '00:00:00'), ('2019-01-01', '24:00:00')):
+            with self.assertRaises(ValueError):
+                parse_datetimes([date], [time])
+
+
+class TestParseEvents(unittest.TestCase):
+    namespace = "http://www.wldelft.nl/fews/PI"
+    series = (
+        f'<series xmlns="{namespace}"><header><locationId>SL000253</locationId>'
+        '<parameterId>Q.B.5</parameterId><timeStep unit="minute" multiplier="5"/>'
+        '<startDate date="2018-04-12" time="09:15:00"/><endDate date="2018-04-12" time="09:25:00"/>'
+        '<missVal>NaN</missVal><stationName>Ameide, Broekseweg_P1</stationName></header>'
+        '<event date="2018-04-12" time="09:15:00" value="1.50" flag="0"/>'
+        '<event date="2018-04-12" time="09:20:00" value="2"/>'
+        '<event date="2018-04-12" time="09:25:00" value="3" flag="2"/>'
+        '</series>')
+
+    def assertFlagsAligned(self, series):
+        timeserie = TimeSerie(series, self.namespace)
+
+        self.assertEqual(len(timeserie.events), 3)
+        self.assertListEqual(timeserie.events.flag.tolist(), [0, NO_FLAG, 2])
+        self.assertListEqual(timeserie.to_table().to_block()[:, 2:].tolist(),
+                             [['1.50', '0'], ['2', ''], ['3', '2']])
+
+    def test_event_without_flag(self):
+        self.assertFlagsAligned(ET.fromstring(self.series))
+
+    @unittest.skipUnless(importlib.util.find_spec('lxml'), 'requires lxml')
+    def test_event_without_flag_lxml(self):
+        from lxml import etree
+
+        self.assertFlagsAligned(etree.fromstring(self.series))
+
+
+class TestFloat32Events(unittest.TestCase):
+    start = dt.datetime(2023, 4, 1)
+    timedelta = dt.timedelta(minutes=15)
+
+    def test_from_values(self):
+        value = np.array([0.1, -999, -1.606, np.nan], dtype=np.float32)
+        events = Events.from_values(value, self.start, self.timedelta, '-999')
+
+        self.assertEqual(events.value.dtype, np.float32)
+        self.assertEqual(events.datetime[-1], np.datetime64('2023-04-01T00:45:00'))
+        self.assertListEqual(format_values(events.value, '-999'), ['0.1', '-999', '-1.606', '-999'])
+
+        missing = Events.from_values(np.full(3, -999, dtype=np.float32), self.start,
+                                     self.timedelta, '-999')
+        self.assertEqual(len(missing), 0)
+
+    def test_outer_join_float32_float64(self):
+        float32 = Events.from_values(
+            np.array([0.1, 12.5], dtype=np.float32), self.start, self.timedelta, 'NaN')
+        float64 = Events.from_strings(
+            ['2023-04-01'], ['00:15:00'], ['0.3'], ['0'], 'NaN')
+
+        table = EventTable.outer_join([float32], [('value', 'flag')])
+        self.assertEqual(table.value.dtype, np.float32)
+
+        table = EventTable.outer_join([float32, float64], [('a', 'b'), ('c', 'd')])
+        self.assertEqual(table.value.dtype, np.float64)
+        self.assertListEqual(format_values(table.value[:, 0], 'NaN'), ['0.1', '12.5'])
+        self.assertListEqual(format_values(table.value[:, 1], 'NaN'), ['NaN', '0.3'])
+
+
 '''
 Add tests ValueError raises in join_events
 '''
@@ -0,0 +1,70 @@
+import os
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from FEWS_tools.lib.parsecache import ParseCache
+from FEWS_tools.scripts.pixml2csv import parse_pixml
+from tests import CONVDATA, OUTPUTPATH, PIXML_TIMESERIES_HL_SL, PIXML_TIMESERIES_HL
+
+
+class TestParseCache(unittest.TestCase):
+    namespace = "http://www.wldelft.nl/fews/PI"
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        self.cache = ParseCache(self.tmpdir / 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def copy(self, filename):
+        return Path(shutil.copy2(CONVDATA / filename, self.tmpdir))
+
+    def test_load_equals_parse(self):
+        xmlfilepath = self.copy(PIXML_TIMESERIES_HL_SL)
+        self.assertIsNone(self.cache.load(xmlfilepath, self.namespace))
+
+        parsed = parse_pixml(xmlfilepath, self.namespace, 'etree')
+        self.cache.store(xmlfilepath, self.namespace, parsed)
+        loaded = self.cache.load(xmlfilepath, self.namespace)
+
+        self.assertEqual(len(loaded), len(parsed))
+        for p, l in zip(parsed, loaded):
+            self.assertEqual(p, l)
+            self.assertEqual(p.group_key, l.group_key)
+            self.assertEqual((p.timedelta, p.start_datetime, p.missVal),
+                             (l.timedelta, l.start_datetime, l.missVal))
+            for column in ('datetime', 'value', 'flag'):
+                np.testing.assert_array_equal(
+                    getattr(p.events, column), getattr(l.events, column))
+
+    def test_changed_file(self):
+        xmlfilepath = self.copy(PIXML_TIMESERIES_HL_SL)
+        self.cache.store(xmlfilepath, self.namespace, parse_pixml(xmlfilepath, self.namespace))
+
+        # touched, the content hash is unchanged
+        os.utime(xmlfilepath, ns=(0, 0))
+        self.assertIsNotNone(self.cache.load(xmlfilepath, self.namespace))
+
+        xmlfilepath.write_bytes(xmlfilepath.read_bytes().replace(b'value="', b'value="1'))
+        self.assertIsNone(self.cache.load(xmlfilepath, self.namespace))
+        self.assertIsNone(self.cache.load(xmlfilepath, 'other namespace'))
+
+    def test_evict_least_recently_used(self):
+        first, second = self.copy(PIXML_TIMESERIES_HL_SL), self.copy(PIXML_TIMESERIES_HL)
+        self.cache.store(first, self.namespace, parse_pixml(first, self.namespace))
+        os.utime(self.cache.entry_path(first), ns=(0, 0))
+
+        self.cache.maxsize = self.cache.entry_path(first).stat().st_size
+        self.cache.store(second, self.namespace, parse_pixml(second, self.namespace))
+
+        self.assertFalse(self.cache.entry_path(first).exists())
+        self.assertIsNotNone(self.cache.load(second, self.namespace))
+
+
+if __name__ == '__main__':
+    unittest.main()
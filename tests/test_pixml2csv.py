@@ -1,14 +1,33 @@
+import os
+import shutil
 import unittest
 import tempfile
+import datetime as dt
+import importlib.util
 from pathlib import Path
+from unittest.mock import patch
+import xml.etree.ElementTree as ET
 
-from FEWS_tools.scripts.pixml2csv import convert_pixml2csv
+import numpy as np
+
+from FEWS_tools.lib.utils import ns
+from FEWS_tools.lib.models import TimeSerie, format_values
+from FEWS_tools.scripts.pixml2csv import convert_pixml2csv, iter_groups, iter_timeseries
 from tests import (
-    DEBUG, CONVDATA, OUTPUTPATH,
-    PIXML_TIMESERIES_SL, PIXML_TIMESERIES_HL, PIXML_TIMESERIES_HL_SL, PIXML_TIMESERIES_HL_ORDER)
+    DEBUG, CONVDATA, GOLDDATA, OUTPUTPATH,
+    PIXML_TIMESERIES_SL, PIXML_TIMESERIES_HL, PIXML_TIMESERIES_HL_SL, PIXML_TIMESERIES_HL_ORDER,
+    PIXML_TIMESERIES_VALUES)
+
+
+HAS_LXML = importlib.util.find_spec('lxml') is not None
 
 
 class TestConvertXml2Csv(unittest.TestCase):
+    parser = 'etree'
+
+    def convert(self, *args, **kwargs):
+        return convert_pixml2csv(*args, parser=self.parser, **kwargs)
+
     def setUp(self):
         self.tmp_output_folder = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
 
@@ -19,37 +38,37 @@ class TestConvertXml2Csv(unittest.TestCase):
             self.tmp_output_folder.rmdir()
 
     def test_equidistant_sublocation_separate_files(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_SL, self.tmp_output_folder, join_events=False)
+        self.convert(CONVDATA, PIXML_TIMESERIES_SL, self.tmp_output_folder, join_events=False)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 3)
 
     def test_nonequidistant_sublocations(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL, self.tmp_output_folder)
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL, self.tmp_output_folder)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 7)
 
     def test_equidistant_sublocations_separate_files(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, join_events=False)
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, join_events=False)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 10)
 
     def test_equidistant_sublocations(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder)
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 9)
     
     def test_equidistant_timeseries_H_to_SL(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder, H_to_SL=True)
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder, H_to_SL=True)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 2)
 
     def test_equidistant_timeseries_inputorder_is_outputorder(self):
-        convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder)
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder)
 
         H_group = 'Ameide, Broekseweg_H_T5.csv'
         P1_group = 'Ameide, Broekseweg_P1_T5.csv'
@@ -75,25 +94,338 @@ class TestConvertXml2Csv(unittest.TestCase):
 
     def test_equidistant_timeseries_xmlfilepattern(self):
         xmlfilepattern = 'ExportOpvlWerkT*.xml'
-        convert_pixml2csv(CONVDATA, xmlfilepattern, self.tmp_output_folder)
+        self.convert(CONVDATA, xmlfilepattern, self.tmp_output_folder)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 3)
 
     def test_equidistant_timeseries_xmlfilepattern_separate_events(self):
         xmlfilepattern = 'ExportOpvlWerkT*.xml'
-        convert_pixml2csv(CONVDATA, xmlfilepattern, self.tmp_output_folder, join_events=False)
+        self.convert(CONVDATA, xmlfilepattern, self.tmp_output_folder, join_events=False)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 11)
 
     def test_equidistant_timeseries_xmlfilepattern_H_to_SL(self):
         xmlfilepattern = 'ExportOpvlWerkT*.xml'
-        convert_pixml2csv(CONVDATA, xmlfilepattern, self.tmp_output_folder, H_to_SL=True)
+        self.convert(CONVDATA, xmlfilepattern, self.tmp_output_folder, H_to_SL=True)
         written_files = sorted(Path(self.tmp_output_folder).iterdir())
 
         self.assertEqual(len(written_files), 2)
 
 
+    def test_workers_output_equals_serial(self):
+        xmlfilepattern = 'ExportOpvlWerkT*.xml'
+        serial_folder = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        if not DEBUG:
+            self.addCleanup(shutil.rmtree, serial_folder)
+        self.convert(CONVDATA, xmlfilepattern, serial_folder, H_to_SL=True)
+        self.convert(
+            CONVDATA, xmlfilepattern, self.tmp_output_folder, H_to_SL=True, workers=2)
+
+        serial_files = sorted(serial_folder.iterdir())
+        self.assertEqual(len(serial_files), 2)
+        for serial_file in serial_files:
+            parallel_file = self.tmp_output_folder / serial_file.name
+            self.assertEqual(serial_file.read_bytes(), parallel_file.read_bytes())
+
+    def assertGoldenFiles(self, golden_folder):
+        written_files = sorted(i.name for i in self.tmp_output_folder.iterdir())
+        golden_files = sorted(i.name for i in golden_folder.iterdir())
+        self.assertListEqual(written_files, golden_files)
+
+        for file in golden_files:
+            written = (self.tmp_output_folder / file).read_bytes()
+            self.assertEqual(written, (golden_folder / file).read_bytes(), file)
+
+    def test_golden_files_sublocations(self):
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder)
+        self.assertGoldenFiles(GOLDDATA / 'hl_sl')
+
+    def test_golden_files_H_to_SL(self):
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder, H_to_SL=True)
+        self.assertGoldenFiles(GOLDDATA / 'hl_order_H_to_SL')
+
+    def test_golden_files_values(self):
+        # value strings are written as exported, events without a flag and extra attributes
+        self.convert(CONVDATA, PIXML_TIMESERIES_VALUES, self.tmp_output_folder)
+        self.assertGoldenFiles(GOLDDATA / 'values')
+
+    def test_keep_newest_export(self):
+        exports = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        expected_folder = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        if not DEBUG:
+            self.addCleanup(shutil.rmtree, exports)
+            self.addCleanup(shutil.rmtree, expected_folder)
+
+        # a.xml is the newest export, the name order is the other way around
+        text = (CONVDATA / PIXML_TIMESERIES_HL_SL).read_text()
+        (exports / 'a.xml').write_text(text.replace('flag="0"', 'flag="6"'))
+        (exports / 'b.xml').write_text(text)
+        os.utime(exports / 'b.xml', ns=(0, 0))
+
+        for keep, expected in (('last', 'a.xml'), ('first', 'b.xml')):
+            self.convert(exports, '*.xml', self.tmp_output_folder, keep=keep)
+            self.convert(exports, expected, expected_folder)
+            self.assertGoldenFiles(expected_folder)
+
+    def test_column_order_by_name(self):
+        exports = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        expected_folder = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+        if not DEBUG:
+            self.addCleanup(shutil.rmtree, exports)
+            self.addCleanup(shutil.rmtree, expected_folder)
+        self.convert(CONVDATA, 'ExportOpvlWerkT*.xml', expected_folder)
+
+        # exports rewritten in reverse name order
+        for mtime, xmlfilepath in enumerate(sorted(CONVDATA.glob('ExportOpvlWerkT*.xml'))[::-1]):
+            shutil.copy(xmlfilepath, exports)
+            os.utime(exports / xmlfilepath.name, ns=(mtime, mtime))
+        self.convert(exports, 'ExportOpvlWerkT*.xml', self.tmp_output_folder)
+        self.assertGoldenFiles(expected_folder)
+
+    def test_golden_files_chunked(self):
+        with patch('FEWS_tools.scripts.pixml2csv.CHUNKSIZE', 3):
+            self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder)
+        self.assertGoldenFiles(GOLDDATA / 'hl_sl')
+
+    def test_golden_files_pipelined(self):
+        with patch('FEWS_tools.scripts.pixml2csv.PIPELINE_MAXSIZE', 1):
+            self.convert(CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder,
+                         H_to_SL=True, pipeline=True, writer_threads=1)
+        self.assertGoldenFiles(GOLDDATA / 'hl_order_H_to_SL')
+
+        for file in self.tmp_output_folder.iterdir():
+            file.unlink()
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder,
+                     pipeline=True, writer_threads=4)
+        self.assertGoldenFiles(GOLDDATA / 'hl_sl')
+
+    def test_append_equals_golden_files(self):
+        golden_folder = GOLDDATA / 'hl_sl'
+        for golden in golden_folder.iterdir():
+            header, *rows = golden.read_bytes().splitlines(keepends=True)
+
+            # truncated history, changed last row and rows before the export period
+            if golden.name.startswith('Ameide, Broekseweg_P1'):
+                content = [header, *rows[:-2]]
+            elif golden.name.startswith('Ameide, Broekseweg_H'):
+                content = [header, *rows[:-1], rows[-1].replace(b',2\r\n', b',6\r\n')]
+            else:
+                content = [header, b'2000' + rows[0][4:], *rows]
+            (self.tmp_output_folder / golden.name).write_bytes(b''.join(content))
+
+        with patch('FEWS_tools.scripts.pixml2csv.TAIL_BLOCKSIZE', 16):
+            self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, append=True)
+
+        for golden in golden_folder.iterdir():
+            written = (self.tmp_output_folder / golden.name).read_bytes()
+            if golden.name.startswith(('Ameide, Broekseweg_P1', 'Ameide, Broekseweg_H')):
+                self.assertEqual(written, golden.read_bytes(), golden.name)
+            else:
+                header, *rows = golden.read_bytes().splitlines(keepends=True)
+                self.assertEqual(
+                    written, b''.join([header, b'2000' + rows[0][4:], *rows]))
+
+    def test_append_matches_columns_by_name(self):
+        golden = GOLDDATA / 'hl_sl' / 'Ameide, Broekseweg_H_T5.csv'
+        header, *rows = golden.read_bytes().splitlines(keepends=True)
+        swap = lambda x: b','.join([*x.split(b',')[:2], *x.rstrip().split(b',')[4:],
+                                   *x.split(b',')[2:4]]) + b'\r\n'
+        history = swap(b'2000' + rows[0][4:])
+        content = b''.join([swap(header), history, *map(swap, rows[:-1])])
+        filepath = self.tmp_output_folder / golden.name
+        filepath.write_bytes(content)
+
+        # the columns of the file are kept, as is its history
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, append=True)
+        self.assertEqual(filepath.read_bytes(), content + swap(rows[-1]))
+
+        # other columns are merged, new series are missing in the history
+        filepath.write_bytes(b''.join([
+            b'date,time,value_Hbov_H.M.5,flag_Hbov_H.M.5,value_X,flag_X\r\n',
+            b'2000-04-12,09:15:00,-1.455,2,1,0\r\n']))
+        with self.assertLogs('FEWS_tools', 'WARNING'):
+            self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, append=True)
+        self.assertEqual(filepath.read_bytes(), b''.join(
+            [header, b'2000-04-12,09:15:00,-1.455,2,NaN,9\r\n', *rows]))
+
+    def test_append_keeps_rows_written_by_pandas(self):
+        from FEWS_tools.scripts.flagging2discharge import read_table, write_table
+
+        # a flag update rewrites the files with pandas, columns with missing values are
+        # floats and 1 is written as 1.0
+        for golden in (GOLDDATA / 'hl_sl').iterdir():
+            df = read_table(golden)
+            df = df.astype({i: float for i in df.columns if i.startswith(('value', 'flag'))})
+            write_table(df, self.tmp_output_folder / golden.name)
+        rewritten = {i.name: i.read_bytes() for i in self.tmp_output_folder.iterdir()}
+        self.assertTrue(any(b'.0,' in i for i in rewritten.values()))
+
+        self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder, append=True)
+        for name, content in rewritten.items():
+            self.assertEqual((self.tmp_output_folder / name).read_bytes(), content, name)
+
+    def test_parse_cache_equals_golden_files(self):
+        with tempfile.TemporaryDirectory(dir=OUTPUTPATH) as cache_folder:
+            self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder,
+                         join_events=False, cache_folder=cache_folder)
+            for file in self.tmp_output_folder.iterdir():
+                file.unlink()
+
+            # a re-run with other options is served from the cache
+            with patch('FEWS_tools.scripts.pixml2csv.parse_pixml', side_effect=AssertionError):
+                self.convert(CONVDATA, PIXML_TIMESERIES_HL_SL, self.tmp_output_folder,
+                             cache_folder=cache_folder)
+        self.assertGoldenFiles(GOLDDATA / 'hl_sl')
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'requires pyarrow')
+    def test_parquet_equals_csv(self):
+        import pandas as pd
+
+        self.convert(
+            CONVDATA, PIXML_TIMESERIES_HL_ORDER, self.tmp_output_folder, H_to_SL=True,
+            file_format='parquet')
+        written_files = sorted(self.tmp_output_folder.iterdir())
+        self.assertEqual(len(written_files), 2)
+
+        for file in written_files:
+            self.assertEqual(file.suffix, '.parquet')
+            golden = GOLDDATA / 'hl_order_H_to_SL' / f'{file.stem}.csv'
+            expected = pd.read_csv(golden, parse_dates=['date'], dtype={'time': str})
+
+            result = pd.read_parquet(file)
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+            self.assertTrue(all(result[i].dtype == 'int8' for i in result if i.startswith('flag')))
+
+
+@unittest.skipUnless(HAS_LXML, 'requires lxml')
+class TestConvertXml2CsvLxml(TestConvertXml2Csv):
+    parser = 'lxml'
+
+
+class TestPiBinary(unittest.TestCase):
+    namespace = "http://www.wldelft.nl/fews/PI"
+    parser = 'etree'
+
+    # stationName, parameterId, startDate, missVal and values of each series
+    series = [
+        ('Gemaal_P1', 'Q.B.15', '2023-04-01', 'NaN', [0.1, 12.5, np.nan, -1.606]),
+        ('Gemaal_VL1', 'TT.15', '2023-04-01', '-999', [-999, 1, 2.25, 3e-05]),
+        ('Gemaal_P2', 'Q.B.15', '2023-04-02', '-999', [-999, -999]),
+        ]
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(dir=OUTPUTPATH))
+
+    def tearDown(self):
+        if not DEBUG:
+            shutil.rmtree(self.tmpdir)
+
+    def write_pixml(self, folder, binary):
+        '''the series as PI-XML with events, or as PI-XML headers with a PI binary file'''
+        folder.mkdir()
+        series = []
+        for stationName, parameterId, date, missVal, values in self.series:
+            values = np.array(values, dtype=np.float32)
+            end = dt.datetime.fromisoformat(date) + (len(values) - 1) * dt.timedelta(minutes=15)
+            header = (
+                f'<series><header><locationId>{stationName}</locationId>'
+                f'<parameterId>{parameterId}</parameterId>'
+                f'<timeStep unit="minute" multiplier="15"/>'
+                f'<startDate date="{date}" time="00:00:00"/>'
+                f'<endDate date="{end:%Y-%m-%d}" time="{end:%H:%M:%S}"/>'
+                f'<missVal>{missVal}</missVal><stationName>{stationName}</stationName>'
+                f'</header>')
+            timestamps = np.datetime64(date) + np.arange(len(values)) * np.timedelta64(15, 'm')
+            # value strings in the form written for binary values
+            texts = format_values(np.where(values == -999, np.nan, values), missVal)
+            events = ''.join(
+                f'<event date="{str(t)[:10]}" time="{str(t)[11:19]}" value="{v}" flag="0"/>'
+                for t, v in zip(timestamps.astype('datetime64[s]'), texts))
+            series.append(header + ('' if binary else events) + '</series>')
+
+            if binary:
+                with open(folder / 'export.bin', 'ab') as fw:
+                    fw.write(values.astype('<f4').tobytes())
+
+        (folder / 'export.xml').write_text(
+            f'<TimeSeries xmlns="{self.namespace}">{"".join(series)}</TimeSeries>')
+
+    def test_binary_equals_events(self):
+        for folder, binary in (('xml', False), ('bin', True)):
+            self.write_pixml(self.tmpdir / folder, binary)
+            convert_pixml2csv(self.tmpdir / folder, '*.xml', parser=self.parser)
+
+        written = sorted(i.name for i in (self.tmpdir / 'bin').glob('*.csv'))
+        self.assertListEqual(written, ['Gemaal_P1_T15.csv', 'Gemaal_VL1_T15.csv'])
+        for file in written:
+            self.assertEqual((self.tmpdir / 'bin' / file).read_bytes(),
+                             (self.tmpdir / 'xml' / file).read_bytes(), file)
+
+    def test_binary_values_memory_mapped(self):
+        self.write_pixml(self.tmpdir / 'bin', binary=True)
+        timeseries = list(iter_timeseries(self.tmpdir / 'bin' / 'export.xml', self.namespace))
+
+        self.assertIsInstance(timeseries[0].events.value, np.memmap)
+        self.assertEqual(timeseries[0].events.value.dtype, np.float32)
+        self.assertFalse(timeseries[2].has_events)
+
+        # the binary file is mapped once, the values of each series are views
+        binfilepath = self.tmpdir / 'bin' / 'export.bin'
+        self.assertEqual(len(timeseries[0].events.value.base), binfilepath.stat().st_size // 4)
+
+    def test_binary_too_short(self):
+        self.write_pixml(self.tmpdir / 'bin', binary=True)
+        binfilepath = self.tmpdir / 'bin' / 'export.bin'
+        binfilepath.write_bytes(binfilepath.read_bytes()[:-4])
+
+        with self.assertRaises(ValueError):
+            list(iter_timeseries(self.tmpdir / 'bin' / 'export.xml', self.namespace))
+
+
+@unittest.skipUnless(HAS_LXML, 'requires lxml')
+class TestPiBinaryLxml(TestPiBinary):
+    parser = 'lxml'
+
+
+class TestIterTimeseries(unittest.TestCase):
+    namespace = "http://www.wldelft.nl/fews/PI"
+    parser = 'etree'
+
+    def test_iter_timeseries_equals_full_parse(self):
+        xmlfilepath = CONVDATA / PIXML_TIMESERIES_HL_SL
+        root = ET.parse(xmlfilepath).getroot()
+        parsed = [TimeSerie(i, self.namespace) for i in root.iter(ns('series', self.namespace))]
+        streamed = list(iter_timeseries(xmlfilepath, self.namespace, self.parser))
+
+        self.assertEqual(len(streamed), len(parsed))
+        for p, s in zip(parsed, streamed):
+            self.assertEqual((p.locationId, p.parameterId), (s.locationId, s.parameterId))
+            self.assertEqual(len(p.events), len(s.events))
+
+
+@unittest.skipUnless(HAS_LXML, 'requires lxml')
+class TestIterTimeseriesLxml(TestIterTimeseries):
+    parser = 'lxml'
+
+
+class TestIterGroups(unittest.TestCase):
+    namespace = "http://www.wldelft.nl/fews/PI"
+
+    def test_keep_duplicates(self):
+        xmlfilepath = CONVDATA / PIXML_TIMESERIES_HL_SL
+        first = list(iter_timeseries(xmlfilepath, self.namespace, 'etree'))
+        last = list(iter_timeseries(xmlfilepath, self.namespace, 'etree'))
+        TimeSerie.record_input_order(first + last)
+
+        for keep, expected in (('first', first), ('last', last)):
+            groups = list(iter_groups(first + last, keep=keep))
+            grouped = [i for _, group in groups for i in group]
+
+            self.assertEqual(len(groups), 9)
+            self.assertTrue(all(any(i is j for j in expected) for i in grouped))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import json
+import unittest
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+from FEWS_tools.lib.profiling import Profiler, profiler, report_path
+from FEWS_tools.scripts.pixml2csv import convert_pixml2csv
+from tests import CONVDATA, OUTPUTPATH, PIXML_TIMESERIES_HL_SL
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = Profiler()
+        self.profiler.enable()
+
+    def tearDown(self):
+        self.profiler.disable()
+
+    def test_stages_accumulate(self):
+        for _ in range(3):
+            with self.profiler.stage('write') as stage:
+                stage.add(files=1, rows=10)
+
+        write = self.profiler.report()['stages']['write']
+        self.assertEqual(write['calls'], 3)
+        self.assertDictEqual(write['items'], {'files': 3, 'rows': 30})
+
+    def test_nested_peak_memory(self):
+        self.profiler.enable(trace_memory=True)
+        with self.profiler.stage('outer'):
+            with self.profiler.stage('inner'):
+                block = bytearray(2**22)
+            del block
+
+        stages = self.profiler.report()['stages']
+        self.assertGreaterEqual(stages['inner']['peak_memory'], 2**22)
+        self.assertGreaterEqual(stages['outer']['peak_memory'], stages['inner']['peak_memory'])
+
+    def test_memory_not_traced_by_default(self):
+        with self.profiler.stage('parse'):
+            self.assertFalse(tracemalloc.is_tracing())
+
+        report = self.profiler.report()
+        self.assertFalse(report['trace_memory'])
+        self.assertIsNone(report['stages']['parse']['peak_memory'])
+
+    def test_disabled(self):
+        self.profiler.disable()
+        with self.profiler.stage('parse') as stage:
+            stage.add(series=1)
+        self.assertDictEqual(self.profiler.report()['stages'], {})
+
+    def test_report_path(self):
+        self.assertEqual(report_path(Path('logs/run.log')), Path('logs/run.profile.json'))
+
+
+class TestProfileConvert(unittest.TestCase):
+    def test_convert_pixml2csv_stages(self):
+        with tempfile.TemporaryDirectory(dir=OUTPUTPATH) as tmpdir:
+            profiler.enable()
+            try:
+                convert_pixml2csv(CONVDATA, PIXML_TIMESERIES_HL_SL, Path(tmpdir))
+                profiler.write(Path(tmpdir) / 'profile.json', command='pixml2csv')
+            finally:
+                profiler.disable()
+            report = json.loads((Path(tmpdir) / 'profile.json').read_text())
+            n_files = len(list(Path(tmpdir).glob('*.csv')))
+
+        stages = report['stages']
+        self.assertListEqual(list(stages), ['parse', 'group', 'join', 'write'])
+        self.assertEqual(stages['parse']['items']['series'], 25)
+        self.assertEqual(stages['write']['items']['files'], n_files)
+        self.assertEqual(stages['group']['items']['groups'], n_files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from FEWS_tools.lib.rules import RuleIndex, cache_path, load_rule_index
+from FEWS_tools.scripts.flagging2discharge import FLAG_MAPPING
+from tests import DAMO_POMP, OUTPUTPATH
+
+
+class TestRuleIndex(unittest.TestCase):
+    flag_mapping = FLAG_MAPPING['DAMO_pomp']
+
+    def setUp(self):
+        self.tmp_folder = Path(tempfile.mkdtemp(dir=OUTPUTPATH, prefix='rules_'))
+        self.damo_pomp = Path(shutil.copy(DAMO_POMP, self.tmp_folder))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_folder)
+
+    def test_rule_index(self):
+        rule_index = RuleIndex.from_file(self.damo_pomp, self.flag_mapping)
+        self.assertEqual(set(rule_index), {'SL000253', 'SL000276'})
+
+        rules = rule_index['SL000253']
+        self.assertEqual(len(rules), 3)
+        self.assertTrue(np.all(rules.begins[1:] >= rules.begins[:-1]))
+        self.assertEqual(rules.begins[0], np.datetime64('1900-01-01'))
+        self.assertEqual(rules.ends[0], np.datetime64('2010-01-03'))
+        self.assertListEqual(rules.typeformule, ['Bedrijfsstatus', 'Ampere', 'Toerental'])
+        self.assertListEqual(rules.params, [('BS',), ('A',), ('TT',)])
+
+    def test_rule_index_cache(self):
+        rule_index = load_rule_index(self.damo_pomp, self.flag_mapping)
+        self.assertTrue(cache_path(self.damo_pomp).exists())
+
+        # unchanged file is not parsed again, also not when only the mtime changed
+        with patch.object(RuleIndex, 'from_file') as from_file:
+            self.assertEqual(set(load_rule_index(self.damo_pomp, self.flag_mapping)), set(rule_index))
+            os.utime(self.damo_pomp, ns=(0, 0))
+            self.assertEqual(set(load_rule_index(self.damo_pomp, self.flag_mapping)), set(rule_index))
+            from_file.assert_not_called()
+
+        # changed content is parsed again
+        with open(self.damo_pomp, 'a') as fa:
+            fa.write('1;;KGM_000001;SL000001;Test_P1;Pompvijzel;Ampere;1;1;1;0;01-01-2000;01-01-2001;2\n')
+        self.assertIn('SL000001', load_rule_index(self.damo_pomp, self.flag_mapping))
+
+        # a different flag mapping is part of the key
+        rule_index = load_rule_index(self.damo_pomp, {'Ampere': ['AMP']})
+        self.assertListEqual(rule_index['SL000001'].params, [('AMP',)])
+
+
+if __name__ == '__main__':
+    unittest.main()
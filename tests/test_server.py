@@ -0,0 +1,103 @@
+import os
+import socket
+import unittest
+import tempfile
+import threading
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+from multiprocessing import AuthenticationError
+
+from FEWS_tools.scripts.server import load_authkey, serve, submit
+from tests import BASEPATH, CONVDATA, GOLDDATA, OUTPUTPATH, PIXML_TIMESERIES_HL_SL
+
+
+def free_address():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return f'localhost:{s.getsockname()[1]}'
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        # a key file of the test, not the one of the user
+        self.keydir = tempfile.TemporaryDirectory(dir=OUTPUTPATH)
+        self.addCleanup(self.keydir.cleanup)
+        self.key_file = Path(self.keydir.name) / 'authkey'
+        for patcher in (patch('FEWS_tools.scripts.server.KEY_FILE', self.key_file),
+                        patch.dict(os.environ, {'FEWS_TOOLS_AUTHKEY': ''})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_serve_runs_jobs(self):
+        address = free_address()
+        server = threading.Thread(target=serve, args=(address,))
+        server.start()
+
+        with tempfile.TemporaryDirectory(dir=OUTPUTPATH) as tmpdir:
+            argv = ['pixml2csv', '-b', str(CONVDATA), '-f', PIXML_TIMESERIES_HL_SL, '-o', tmpdir]
+            for _ in range(10):
+                try:
+                    self.assertEqual(submit(address, argv), 0)
+                    break
+                except (ConnectionRefusedError, RuntimeError):
+                    server.join(0.2)
+
+            written_files = sorted(i.name for i in Path(tmpdir).iterdir())
+            golden_files = sorted(i.name for i in (GOLDDATA / 'hl_sl').iterdir())
+            self.assertListEqual(written_files, golden_files)
+
+            # failures are returned to the caller, the server keeps running
+            argv = ['flagging2discharge', '-b', tmpdir, '-p', str(Path(tmpdir) / 'missing.csv')]
+            self.assertEqual(submit(address, argv), 1)
+
+            # watch would block the server
+            self.assertEqual(submit(address, ['watch', '-b', tmpdir, '-f', '*.xml']), 1)
+
+        # the generated key is private, other keys are refused
+        if os.name == 'posix':
+            self.assertEqual(self.key_file.stat().st_mode & 0o777, 0o600)
+        with patch.dict(os.environ, {'FEWS_TOOLS_AUTHKEY': 'FEWS-tools'}):
+            with self.assertRaises(AuthenticationError):
+                submit(address, ['pixml2csv', '-b', '.', '-f', '*.xml'])
+
+        self.assertEqual(submit(address, [], stop=True), 0)
+        server.join(5)
+        self.assertFalse(server.is_alive())
+
+    def test_authkey(self):
+        with self.assertRaises(RuntimeError):
+            load_authkey()
+
+        authkey = load_authkey(create=True)
+        self.assertEqual(len(authkey), 64)
+        self.assertEqual(load_authkey(), authkey)
+
+        with patch.dict(os.environ, {'FEWS_TOOLS_AUTHKEY': 'secret'}):
+            self.assertEqual(load_authkey(), b'secret')
+
+    @unittest.skipUnless(os.name == 'posix', 'file modes are POSIX')
+    def test_authkey_readable_by_others(self):
+        self.key_file.write_text('secret')
+        self.key_file.chmod(0o644)
+        with self.assertRaises(RuntimeError):
+            load_authkey()
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_pixml2csv_without_pandas(self):
+        with tempfile.TemporaryDirectory(dir=OUTPUTPATH) as tmpdir:
+            code = (
+                'import sys\n'
+                'from FEWS_tools.cli import main\n'
+                f'main(["pixml2csv", "-b", {str(CONVDATA)!r}, "-f", {PIXML_TIMESERIES_HL_SL!r}, '
+                f'"-o", {tmpdir!r}])\n'
+                'print("pandas" in sys.modules)\n')
+            result = subprocess.run(
+                [sys.executable, '-c', code], cwd=BASEPATH, capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), 'False', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+
+from FEWS_tools.scripts.pixml2csv import convert_pixml2csv, parse_pixml
+from FEWS_tools.scripts.watch import CACHE_FOLDER, MANIFEST_FILE, Watcher
+from tests import (
+    DEBUG, CONVDATA, FLAGDATA, GOLDDATA, DAMO_POMP, OUTPUTPATH, PIXML_TIMESERIES_HL_SL,
+    PIXML_TIMESERIES_SL)
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(dir=OUTPUTPATH, prefix='watch_'))
+        self.exports = self.tmpdir / 'exports'
+        self.output = self.tmpdir / 'output'
+        self.exports.mkdir()
+        self.output.mkdir()
+
+    def tearDown(self):
+        if not DEBUG:
+            shutil.rmtree(self.tmpdir)
+
+    def watcher(self, **kwargs):
+        return Watcher(self.exports, '*.xml', self.output, settle=0,
+                       convert_options={'parser': 'etree'}, **kwargs)
+
+    def test_convert_new_and_changed_exports(self):
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        watcher = self.watcher()
+        self.assertEqual(watcher.poll(), (1, 0))
+        self.assertEqual(watcher.poll(), (0, 0))
+
+        golden_files = sorted(i.name for i in (GOLDDATA / 'hl_sl').iterdir())
+        self.assertListEqual(sorted(i.name for i in self.output.iterdir()), golden_files)
+        for file in golden_files:
+            self.assertEqual((self.output / file).read_bytes(),
+                             (GOLDDATA / 'hl_sl' / file).read_bytes(), file)
+
+        # the manifest is kept, a changed export is converted again
+        self.assertTrue((self.exports / MANIFEST_FILE).exists())
+        self.assertEqual(self.watcher().poll(), (0, 0))
+
+        os.utime(self.exports / PIXML_TIMESERIES_HL_SL, ns=(0, 0))
+        self.assertEqual(self.watcher().poll(), (1, 0))
+
+    def test_convert_exports_of_joined_file(self):
+        expected_folder = self.tmpdir / 'expected'
+        expected_folder.mkdir()
+        convert_pixml2csv(CONVDATA, 'ExportOpvlWerkT*.xml', expected_folder, parser='etree')
+        for file in CONVDATA.glob('ExportOpvlWerkT*.xml'):
+            shutil.copy(file, self.exports)
+        watcher = self.watcher()
+        self.assertEqual(watcher.convert_options['cache_folder'], self.exports / CACHE_FOLDER)
+        self.assertEqual(watcher.poll(), (8, 0))
+
+        # the series of the other exports are kept, read from the parse cache
+        os.utime(self.exports / 'ExportOpvlWerkT5_BS.5.xml', ns=(0, 0))
+        with patch('FEWS_tools.scripts.pixml2csv.parse_pixml', wraps=parse_pixml) as parsed:
+            self.assertEqual(watcher.poll(), (1, 0))
+        parsed.assert_not_called()
+
+        expected_files = sorted(i.name for i in expected_folder.iterdir())
+        self.assertListEqual(sorted(i.name for i in self.output.iterdir()), expected_files)
+        for file in expected_files:
+            self.assertEqual((self.output / file).read_bytes(),
+                             (expected_folder / file).read_bytes(), file)
+
+    def test_failed_export(self):
+        (self.exports / 'broken.xml').write_text('<TimeSeries>')
+        watcher = self.watcher()
+
+        with self.assertLogs('FEWS_tools', 'ERROR'):
+            self.assertEqual(watcher.poll(), (0, 0))
+        self.assertIn('broken.xml', watcher.manifest.files)
+        self.assertEqual(watcher.poll(), (0, 0))
+
+    def test_failed_and_good_export(self):
+        (self.exports / 'broken.xml').write_text('<TimeSeries>')
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        watcher = self.watcher()
+
+        with self.assertLogs('FEWS_tools', 'ERROR'):
+            self.assertEqual(watcher.poll(), (1, 0))
+        self.assertEqual(watcher.poll(), (0, 0))
+
+        golden_files = sorted(i.name for i in (GOLDDATA / 'hl_sl').iterdir())
+        self.assertListEqual(sorted(i.name for i in self.output.iterdir()), golden_files)
+
+        # the failed export is left out until it changes
+        self.assertTrue(watcher.manifest.failed(self.exports, 'broken.xml'))
+        os.utime(self.exports / PIXML_TIMESERIES_HL_SL, ns=(0, 0))
+        with patch('FEWS_tools.scripts.watch.convert_files') as convert_files:
+            self.assertEqual(watcher.poll(), (1, 0))
+        self.assertListEqual(convert_files.call_args.args[0],
+                             [self.exports / PIXML_TIMESERIES_HL_SL])
+
+    def test_export_changed_during_conversion(self):
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        export = self.exports / PIXML_TIMESERIES_HL_SL
+        watcher = self.watcher()
+
+        def convert_files(*args, **kwargs):
+            os.utime(export, ns=(0, 0))
+            return []
+
+        with patch('FEWS_tools.scripts.watch.convert_files', side_effect=convert_files):
+            self.assertEqual(watcher.poll(), (1, 0))
+        # recorded as it was read, the rewritten export is converted again
+        self.assertEqual(watcher.poll(), (1, 0))
+        self.assertEqual(watcher.poll(), (0, 0))
+
+    def test_failed_conversion_is_retried(self):
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        watcher = self.watcher()
+
+        with patch('FEWS_tools.scripts.watch.convert_files', side_effect=OSError), \
+                self.assertLogs('FEWS_tools', 'ERROR'):
+            self.assertEqual(watcher.poll(), (0, 0))
+        self.assertEqual(watcher.poll(), (1, 0))
+
+    def test_exports_wait_for_unsettled_export(self):
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        watcher = self.watcher()
+        self.assertEqual(watcher.poll(), (1, 0))
+
+        # a changed export is converted with the others once these are written
+        os.utime(self.exports / PIXML_TIMESERIES_HL_SL, ns=(0, 0))
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_SL, self.exports)
+        watcher.settle = 60
+        self.assertEqual(watcher.poll(), (0, 0))
+        self.assertEqual(len(watcher.unsettled), 2)
+
+        watcher.settle = 0
+        self.assertEqual(watcher.poll(), (2, 0))
+
+    def test_unsettled_export(self):
+        shutil.copy(CONVDATA / PIXML_TIMESERIES_HL_SL, self.exports)
+        watcher = self.watcher()
+        watcher.settle = 60
+
+        self.assertEqual(watcher.poll(), (0, 0))
+        self.assertEqual(len(watcher.unsettled), 1)
+
+        watcher.settle = 0
+        watcher.candidates = []
+        self.assertEqual(watcher.poll(), (1, 0))
+        self.assertEqual(len(watcher.unsettled), 0)
+
+    def test_update_flagging(self):
+        for file in (FLAGDATA / 't1').iterdir():
+            shutil.copy(file, self.output)
+        watcher = self.watcher(damo_pomp=DAMO_POMP)
+
+        self.assertEqual(watcher.poll(), (0, 1))
+        # updated in place, the written file is not updated again
+        self.assertEqual(watcher.poll(), (0, 0))
+
+        result_df = pd.read_csv(self.output / 'Bleskensgraaf Noordzijde_P1_T5_SL000253.csv')
+        self.assertListEqual(result_df['flag_P1_Q.B.5'].tolist(), [8, 8, 2, 2, 5, 5, 3, 3, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()